@@ -1,7 +1,18 @@
 import numpy as np
 import random
+import math
+import heapq
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
 from noise import snoise3, snoise2
 from pjg_library.IsoLayer import IsoLayer
+from pjg_library.Path import Path
+from pjg_library.marchingSquares import marching_squares
+from pjg_library import simplexNoise
+from pjg_library import erosion
+
+# Neighbour offsets (row, col) for D8 flow directions: E, SE, S, SW, W, NW, N, NE (rows increase downwards)
+D8_OFFSETS = [(0,1),(1,1),(1,0),(1,-1),(0,-1),(-1,-1),(-1,0),(-1,1)]
 
 class HeightMap:
     """
@@ -11,12 +22,11 @@ class HeightMap:
     - Convenient auto-generation of random perlin noise
     - Set cutoff points
     - Get slope angles and such
+    - Shading: slope(), aspect() and hillshade() return new HeightMaps, so get_isolayer on them gives the outlines of shaded regions.
+        - Probably would need the map to be bigger by 1 in every direction so that the isolines connect as needed on the edges.
+    - Hydraulic and thermal erosion (see erosion.py)
     TODO:
-    - A shading function
-        - Give it an angle 0-2PI for which slopes need to be shaded
-        - The best thing to do might be to make a new HeightMap, populate it with 0/1 depending on if the slope at that point is within tolerance for being shaded, then create an IsoLayer to define the areas that are shaded. Probably would need the map to be bigger by 1 in every direction so that the isolines connect as needed on the edges.
     - set_max / set_min, for customizable max/min values, make the randomize function use these
-    - erosion!
 
     """
     def __init__(self,rows,cols=0):
@@ -28,9 +38,34 @@ class HeightMap:
         self.cols = rows
         if cols != 0:
             self.cols = cols
-        self.values = np.zeros((rows,cols))
-    
-    def randomize(self,x_range=0,y_range=0,octaves=2,warpstrength=1.0,warpsize=0.5,warpoctaves=2):
+        self.values = np.zeros((self.rows,self.cols))
+
+    @classmethod
+    def from_values(cls, values):
+        """Create a HeightMap from a 2D array of values."""
+        values = np.asarray(values, dtype=float)
+        heightmap = cls(values.shape[0], values.shape[1])
+        heightmap.values = values
+        return heightmap
+
+    def _new_values(self):
+        """Storage for a freshly generated map. Generators fill it band by band (see _bands)."""
+        return np.empty((self.rows, self.cols))
+
+    def _bands(self, band_rows):
+        """Yield slices of at most band_rows rows covering the whole map."""
+        band_rows = max(1, band_rows)
+        for row in range(0, self.rows, band_rows):
+            yield slice(row, min(row + band_rows, self.rows))
+
+    def randomize(self,x_range=0,y_range=0,octaves=2,warpstrength=1.0,warpsize=0.5,warpoctaves=2,backend='noise'):
+        """
+        Fill the map with domain-warped simplex noise.
+        backend='noise' calls the noise package once per pixel. This is the reference implementation.
+        backend='numpy' evaluates whole rows of the map at once with simplexNoise.py, which is much faster
+        on large maps. It uses its own permutation table, so it won't reproduce the 'noise' output,
+        but it is seeded from the random module, so random.seed() makes it deterministic.
+        """
         if x_range == 0:
             x_range = self.cols/10.0
         if y_range == 0:
@@ -40,14 +75,30 @@ class HeightMap:
         y_coords = np.linspace(0., y_range, self.rows) # Indexing y vals from 0-10, for y_num points
         x_start = random.random()*10000
         y_start = random.random()*10000
-        self.values = np.array([[(snoise3(x+x_start,y+y_start,warpstrength*snoise2(x*warpsize+x_start,y*warpsize+y_start,octaves=warpoctaves),octaves=octaves)+1.0) / 2.0 for x in x_coords] for y in y_coords])
+        values = self._new_values()
+        if backend == 'noise':
+            for rows in self._bands(self.rows):
+                values[rows] = np.array([[(snoise3(x+x_start,y+y_start,warpstrength*snoise2(x*warpsize+x_start,y*warpsize+y_start,octaves=warpoctaves),octaves=octaves)+1.0) / 2.0 for x in x_coords] for y in y_coords[rows]])
+        elif backend == 'numpy':
+            perm = simplexNoise.permutation(random.getrandbits(32))
+            # Work in bands of rows to keep the temporary arrays small
+            for rows in self._bands(2**16 // self.cols):
+                x, y = np.meshgrid(x_coords, y_coords[rows])
+                warp = warpstrength*simplexNoise.snoise2(x*warpsize+x_start, y*warpsize+y_start, perm, octaves=warpoctaves)
+                values[rows] = (simplexNoise.snoise3(x+x_start, y+y_start, warp, perm, octaves=octaves)+1.0) / 2.0
+        else:
+            raise ValueError(f"Unknown noise backend: {backend}")
+        self.values = values
 
     def gaussian(self, sigma=1.0, spread = 3.0):
         x = np.linspace(-spread, spread, self.cols)
         # TODO: adjust x/y spread individually
         y = np.linspace(-spread, spread, self.rows)
-        X, Y = np.meshgrid(x, y)
-        self.values = np.exp(-(X**2 + Y**2) / (2 * sigma**2))
+        values = self._new_values()
+        for rows in self._bands(self.rows):
+            X, Y = np.meshgrid(x, y[rows])
+            values[rows] = np.exp(-(X**2 + Y**2) / (2 * sigma**2))
+        self.values = values
 
     def set(self,row,col,val):
         # TODO: check range
@@ -60,7 +111,20 @@ class HeightMap:
     def get_values(self):
         return self.values
 
-    def get_isolayer(self, value):
+    def get_isolayer(self, value, vectorized=True):
+        """
+        Get the IsoLayer for a single value.
+        By default the whole grid is contoured with array operations.
+        Set vectorized=False to use the original per-cell loop.
+        Both trace the same contour segments, but the vectorized path assembles them in bulk (see IsoLayer.add_segments),
+        so their order, orientation and loop starting points can differ, which matters for Path.crop and shift.
+        Where grid values are exactly equal to value (e.g. integer maps like flow_direction with an
+        integer value), three or more segment ends can meet at one grid point, and the two paths may
+        join them up differently there, giving a different number of curves over the same segments.
+        """
+        if vectorized:
+            return self.get_topography_values([value])[0]
+
         iso = IsoLayer(value)
         for row in range(self.rows - 1):
             for col in range(self.cols - 1):
@@ -72,13 +136,21 @@ class HeightMap:
                 iso.marching_squares(row, col, topleft, topright, botleft, botright)
         return iso
 
-    def get_topography(self,low=0.0,high=1.0,num_isos=5):
+    def get_topography(self,low=0.0,high=1.0,num_isos=5,vectorized=True,workers=None):
         """
         A more efficient method to get evenly spaced IsoLayers.
         Rather than iterating through all cells for every layer,
         this method iterates through all the cells once.
+        By default the case codes and edge interpolations for every cell and every
+        layer are computed as array operations (see marchingSquares.py).
+        Set vectorized=False to use the original per-cell loop, which is also the only way to get
+        the curves in the per-cell order and orientation (see get_isolayer).
+        Set workers to contour bands of rows on a pool of processes (see get_topography_values).
         """
         isovals = np.linspace(low,high,num_isos+2)
+        if vectorized:
+            return self.get_topography_values(isovals[1:-1], workers=workers)
+
         isos = [IsoLayer(i) for i in isovals[1:-1]]
         for row in range(self.rows - 1):
             for col in range(self.cols - 1):
@@ -91,14 +163,371 @@ class HeightMap:
 
         return isos
 
+    def get_topography_values(self, isovals, compact=False, workers=None):
+        """
+        Get an IsoLayer for each value in isovals, using the vectorized marching squares.
+        If compact is True, the curves are ArrayPaths rather than Paths.
+        The curves trace the same segments as the per-cell loop, but not necessarily in order or orientation,
+        nor split the same way at grid points that lie exactly on an iso value (see get_isolayer).
+
+        If workers is more than 1, the map is split into bands of rows which are contoured and
+        stitched into curves on a pool of that many processes. The values are shared with the workers
+        through shared memory (or through the map file, for a file-backed np.memmap) rather than pickled.
+        Only the curves that end on a row shared by two bands are sent back to be joined (in bulk, see
+        IsoLayer.add_polylines). The rest are sent back packed into one array per band and level, and
+        added without looking for joins. Building the curve objects is still done in this process,
+        and Paths need their points converted to tuples, so use compact=True to get the most from workers.
+        """
+        isos = [IsoLayer(i, compact) for i in isovals]
+        if workers is not None and workers > 1 and self.rows > 2:
+            self._get_topography_parallel(isos, workers, compact)
+            return isos
+
+        for iso, segments in zip(isos, marching_squares(self.values, isovals)):
+            iso.add_segments(segments)
+        return isos
+
+    def _get_topography_parallel(self, isos, workers, compact):
+        isovals = [iso.value for iso in isos]
+        # Two bands per worker keeps the pool busy when some bands have more contours than others.
+        # Every band boundary adds curves for the parent to join, so bands are at least 32 rows.
+        band_rows = max(32, math.ceil((self.rows - 1) / (workers * 2)))
+        # Neighbouring bands share their boundary row
+        bands = [(row, min(row + band_rows, self.rows - 1) + 1) for row in range(0, self.rows - 1, band_rows)]
+
+        shm = None
+        if isinstance(self.values, np.memmap) and self.values.filename is not None:
+            self.values.flush()
+            source = ('file', self.values.filename, self.values.offset)
+        else:
+            shm = shared_memory.SharedMemory(create=True, size=max(1, self.rows * self.cols * 8))
+            shared = np.ndarray((self.rows, self.cols), dtype=np.float64, buffer=shm.buf)
+            for rows in self._bands(2**20 // self.cols):
+                shared[rows] = self.values[rows]
+            del shared
+            source = ('shm', shm.name, 0)
+
+        try:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_contour_worker,
+                                     initargs=(source, (self.rows, self.cols))) as pool:
+                boundary = [[] for _ in isos]
+                interior = [[] for _ in isos]
+                for band_curves in pool.map(_contour_band, bands, [isovals] * len(bands)):
+                    for iso, joining, rest, (band_boundary, points, lengths) in zip(isos, boundary, interior, band_curves):
+                        joining.extend(band_boundary)
+                        rest.extend(iso.path_class.from_packed(points, lengths))
+            # Only curves ending on a row shared with another band can join up, and they are joined in bulk.
+            # The rest can't meet any other curve, so they're added without looking for joins.
+            for iso, joining, rest in zip(isos, boundary, interior):
+                iso.add_polylines(joining)
+                iso.extend_paths(rest)
+        finally:
+            if shm is not None:
+                shm.close()
+                shm.unlink()
+
     def average(self, other):
         self.values = (self.values + other.values) / 2.0
 
-    def astar(self,start,end):
-        # This should eventually be implemented here
-        # May need more parameters? Which directions are allowed, what makes something impassable, etc?
-        # What the heuristic is?
-        # It should return a sequence of cells.
+    def erode(self, droplets=50000, progress=None, **kwargs):
+        """
+        Hydraulic erosion: run droplets over the map, carving channels and depositing sediment in place.
+        Droplets are simulated in batches with array operations. Any keyword arguments are passed
+        on to erosion.hydraulic_erosion (batch_size, max_steps, inertia, capacity, ...).
+        Droplet positions are seeded from the random module, so random.seed() makes it deterministic.
+        progress, if given, is called as progress(done, droplets, elapsed_seconds).
+        Returns the elapsed time in seconds.
+        """
+        rng = np.random.default_rng(random.getrandbits(32))
+        return erosion.hydraulic_erosion(self.values, droplets, rng=rng, progress=progress, **kwargs)
+
+    def thermal_erode(self, iterations=50, talus=0.01, rate=0.5, progress=None):
+        """
+        Thermal erosion: slopes steeper than talus (a height difference between neighbouring cells)
+        crumble onto their lower neighbours. See erosion.thermal_erosion.
+        Returns the elapsed time in seconds.
+        """
+        return erosion.thermal_erosion(self.values, iterations, talus, rate, progress)
+
+    def _gradient(self, z_scale):
+        """Rate of change of height per cell, along columns (x) and rows (y)."""
+        dy, dx = np.gradient(np.asarray(self.values, dtype=float) * z_scale)
+        return dx, dy
 
-        pass
+    def slope(self, z_scale=1.0):
+        """
+        Return a new HeightMap of the slope angle at every cell, from 0.0 (flat) to 1.0 (vertical).
+        z_scale is the height of a value of 1.0, measured in cells.
+        """
+        dx, dy = self._gradient(z_scale)
+        return HeightMap.from_values(np.arctan(np.hypot(dx, dy)) / (np.pi / 2.0))
+
+    def aspect(self, z_scale=1.0):
+        """
+        Return a new HeightMap of the direction each cell faces (its steepest way down),
+        as a fraction of a full turn from 0.0 to 1.0, starting at +x and turning towards +y (down the rows).
+        Flat cells face 0.0.
+        """
+        dx, dy = self._gradient(z_scale)
+        return HeightMap.from_values(np.mod(np.arctan2(-dy, -dx), 2.0 * np.pi) / (2.0 * np.pi))
+
+    def hillshade(self, azimuth=1.25*np.pi, altitude=0.25*np.pi, z_scale=1.0):
+        """
+        Return a new HeightMap of how brightly each cell is lit, from 0.0 (facing away) to 1.0 (facing the light).
+        azimuth is the direction the light comes from, in radians, measured like aspect (the default is the top left).
+        altitude is the angle of the light above the horizon, in radians.
+        """
+        dx, dy = self._gradient(z_scale)
+        # Dot product of the surface normal (-dx, -dy, 1) with the direction towards the light
+        light_x = np.cos(altitude) * np.cos(azimuth)
+        light_y = np.cos(altitude) * np.sin(azimuth)
+        light_z = np.sin(altitude)
+        shade = (light_z - dx * light_x - dy * light_y) / np.sqrt(1.0 + dx * dx + dy * dy)
+        return HeightMap.from_values(np.clip(shade, 0.0, 1.0))
 
+    def flow_direction(self):
+        """
+        Return a new HeightMap of the D8 flow direction of every cell: the index into D8_OFFSETS
+        of its steepest downhill neighbour, or -1 for pits and flats that don't drain anywhere.
+        """
+        heights = np.pad(np.asarray(self.values, dtype=float), 1, constant_values=np.inf)
+        drops = np.empty((len(D8_OFFSETS), self.rows, self.cols))
+        for k, (d_row, d_col) in enumerate(D8_OFFSETS):
+            neighbours = heights[1+d_row:1+d_row+self.rows, 1+d_col:1+d_col+self.cols]
+            drops[k] = (heights[1:-1, 1:-1] - neighbours) / math.hypot(d_row, d_col)
+        direction = np.argmax(drops, axis=0)
+        direction[np.max(drops, axis=0) <= 0] = -1
+        return HeightMap.from_values(direction)
+
+    def flow_accumulation(self, direction=None):
+        """
+        Return a new HeightMap of how many cells drain through every cell (including itself),
+        following the D8 flow directions. Rivers are where this is large.
+        direction is the result of flow_direction(), which is computed if not given.
+
+        Cells are visited in topological order in one pass: each wave adds the totals of all cells
+        with nothing left flowing into them to their downstream cells, which can then go in the next wave.
+        """
+        if direction is None:
+            direction = self.flow_direction()
+        direction = np.asarray(direction.values).astype(np.int64).reshape(-1)
+        offsets = np.array([d_row*self.cols + d_col for d_row, d_col in D8_OFFSETS] + [0])
+        downstream = np.arange(self.rows*self.cols) + offsets[direction]
+        downstream[direction == -1] = -1
+
+        accumulation = np.ones(self.rows*self.cols)
+        draining = downstream >= 0
+        inflow = np.bincount(downstream[draining], minlength=self.rows*self.cols)
+        wave = np.flatnonzero((inflow == 0) & draining)
+        while len(wave):
+            targets = downstream[wave]
+            np.add.at(accumulation, targets, accumulation[wave])
+            np.subtract.at(inflow, targets, 1)
+            targets = np.unique(targets)
+            wave = targets[(inflow[targets] == 0) & draining[targets]]
+        return HeightMap.from_values(accumulation.reshape(self.rows, self.cols))
+
+    def distance_to(self, mask):
+        """
+        Return a new HeightMap of the exact distance, in cells, from every cell to the nearest cell in mask.
+        mask is a boolean array (or a HeightMap, where any non-zero value counts) the same size as this map.
+        Cells are infinitely far away if mask is empty.
+        All the sources are handled together, see _distance_transform.
+        """
+        if isinstance(mask, HeightMap):
+            mask = mask.values
+        return HeightMap.from_values(_distance_transform(np.asarray(mask) != 0))
+
+    def astar(self,start,end,cost=None,connectivity=8,impassable=None,heuristic_weight=1.0):
+        """
+        Find the cheapest path between two cells, given as (row, col).
+        Returns a Path of (x,y) = (col,row) points from start to end, matching IsoLayer curves,
+        or None if end can't be reached.
+
+        cost is called as cost(height_from, height_to, step_length) for every move, and defaults to
+        slope_cost(). Moves go to 8 neighbouring cells, or 4 if connectivity=4. Cells with values of
+        impassable or more can't be entered.
+
+        The open set is a binary heap, and g-scores and parents are flat NumPy arrays indexed by
+        row*cols+col. The heuristic is the octile (or Manhattan) distance times heuristic_weight,
+        which finds the cheapest path as long as every move costs at least its step length.
+        A heuristic_weight above 1 explores less of the map but may return slightly costlier paths.
+
+        The heuristic ignores the cost of climbing, so with the defaults on rough terrain the search
+        expands most of the map: about 1s for 500x500 and 25s for 2000x2000 noise here. Sub-second
+        searches on multi-megacell maps need weighted A* (heuristic_weight of 1.5 or more), which
+        gives up the guarantee of the cheapest path (see benchmarks/bench_astar.py).
+        """
+        if cost is None:
+            cost = slope_cost()
+        rows = self.rows
+        cols = self.cols
+        heights = np.ascontiguousarray(self.values, dtype=np.float64).reshape(-1)
+        start_index = start[0]*cols + start[1]
+        end_index = end[0]*cols + end[1]
+        end_row, end_col = end
+
+        g = np.full(rows*cols, np.inf)
+        parent = np.full(rows*cols, -1, dtype=np.int64)
+        closed = np.zeros(rows*cols, dtype=np.uint8)
+        if impassable is not None:
+            closed[heights >= impassable] = 1
+            if closed[start_index] or closed[end_index]:
+                return None
+        # memoryviews give fast scalar access to the arrays from the loop below
+        height_view = memoryview(heights)
+        g_view = memoryview(g)
+        parent_view = memoryview(parent)
+        closed_view = memoryview(closed)
+
+        diagonal = math.sqrt(2.0)
+        moves = [(-1,0,1.0),(1,0,1.0),(0,-1,1.0),(0,1,1.0)]
+        if connectivity == 8:
+            moves += [(-1,-1,diagonal),(-1,1,diagonal),(1,-1,diagonal),(1,1,diagonal)]
+        elif connectivity != 4:
+            raise ValueError("connectivity must be 4 or 8")
+
+        def heuristic(row, col):
+            d_row = abs(row - end_row)
+            d_col = abs(col - end_col)
+            if connectivity == 8:
+                return heuristic_weight * (max(d_row, d_col) + (diagonal - 1.0) * min(d_row, d_col))
+            return heuristic_weight * (d_row + d_col)
+
+        g_view[start_index] = 0.0
+        open_set = [(heuristic(start[0], start[1]), 0.0, start_index)]
+        while open_set:
+            _, current_g, current = heapq.heappop(open_set)
+            if current == end_index:
+                break
+            if closed_view[current]:
+                continue
+            closed_view[current] = 1
+            row, col = divmod(current, cols)
+            current_height = height_view[current]
+            for d_row, d_col, step in moves:
+                n_row = row + d_row
+                n_col = col + d_col
+                if n_row < 0 or n_row >= rows or n_col < 0 or n_col >= cols:
+                    continue
+                neighbour = current + d_row*cols + d_col
+                if closed_view[neighbour]:
+                    continue
+                new_g = current_g + cost(current_height, height_view[neighbour], step)
+                if new_g < g_view[neighbour]:
+                    g_view[neighbour] = new_g
+                    parent_view[neighbour] = current
+                    heapq.heappush(open_set, (new_g + heuristic(n_row, n_col), new_g, neighbour))
+        else:
+            return None
+
+        cells = [end_index]
+        while cells[-1] != start_index:
+            cells.append(parent_view[cells[-1]])
+        cells.reverse()
+        return Path.from_points([(float(c % cols), float(c // cols)) for c in cells])
+
+def slope_cost(weight=10.0):
+    """A* cost function: step length, plus weight times the change in height (up or down)."""
+    def cost(height_from, height_to, step):
+        return step + weight*abs(height_to - height_from)
+    return cost
+
+def height_cost(weight=1.0):
+    """A* cost function: step length, made longer in proportion to the height of the cell entered."""
+    def cost(height_from, height_to, step):
+        return step * (1.0 + weight*height_to)
+    return cost
+
+def _distance_transform(mask):
+    """
+    Exact Euclidean distance from every cell to the nearest True cell of mask.
+    This is the separable algorithm from Felzenszwalb & Huttenlocher, "Distance Transforms of Sampled Functions":
+    first the distance to the nearest source in the same column, then the lower envelope of parabolas along
+    each row. Every step is run on all columns (or all rows) at once, so the Python loops are only as long as
+    the map is wide or tall.
+    """
+    rows, cols = mask.shape
+    # Squared distance to the nearest source in the same column, sweeping down then up
+    column = np.full((rows, cols), np.inf)
+    last = np.full(cols, -np.inf)
+    for row in range(rows):
+        last = np.where(mask[row], row, last)
+        column[row] = row - last
+    last = np.full(cols, np.inf)
+    for row in range(rows - 1, -1, -1):
+        last = np.where(mask[row], row, last)
+        column[row] = np.minimum(column[row], last - row)
+    f = column * column
+
+    # Lower envelope of the parabolas (c - q)^2 + f[:, q] along every row.
+    # v holds the positions of the parabolas in each row's envelope, z the boundaries between them,
+    # and top the index of the last parabola (-1 while a row's envelope is empty).
+    all_rows = np.arange(rows)
+    v = np.zeros((rows, cols), dtype=np.int64)
+    z = np.full((rows, cols + 1), np.inf)
+    top = np.full(rows, -1)
+    for q in range(cols):
+        active = np.flatnonzero(np.isfinite(f[:, q]))
+        while True:
+            candidates = active[top[active] >= 0]
+            vk = v[candidates, top[candidates]]
+            s = ((f[candidates, q] + q*q) - (f[candidates, vk] + vk*vk)) / (2*q - 2*vk)
+            hidden = s <= z[candidates, top[candidates]]
+            if not hidden.any():
+                break
+            top[candidates[hidden]] -= 1
+        intersection = np.full(rows, -np.inf)
+        intersection[candidates] = s
+        top[active] += 1
+        v[active, top[active]] = q
+        z[active, top[active]] = intersection[active]
+        z[active, top[active] + 1] = np.inf
+
+    distance = np.full((rows, cols), np.inf)
+    has_sources = top >= 0
+    k = np.zeros(rows, dtype=np.int64)
+    for c in range(cols):
+        while True:
+            advance = has_sources & (z[all_rows, k + 1] < c)
+            if not advance.any():
+                break
+            k[advance] += 1
+        vk = v[all_rows, k]
+        distance[:, c] = np.where(has_sources, (c - vk)**2 + f[all_rows, vk], np.inf)
+    return np.sqrt(distance)
+
+# Process pool workers for HeightMap.get_topography_values(workers=N)
+_worker_values = None
+_worker_storage = None
+
+def _init_contour_worker(source, shape):
+    """Attach to the values shared by the parent process."""
+    global _worker_values, _worker_storage
+    kind, name, offset = source
+    if kind == 'file':
+        _worker_values = np.memmap(name, dtype=np.float64, mode='r', shape=shape, offset=offset)
+    else:
+        _worker_storage = shared_memory.SharedMemory(name=name)
+        _worker_values = np.ndarray(shape, dtype=np.float64, buffer=_worker_storage.buf)
+
+def _contour_band(band, isovals):
+    """
+    Contour rows band[0] to band[1]-1 of the shared values and stitch the segments into curves.
+    Returns (boundary, points, lengths) for each iso value: a list of (N,2) point arrays for the
+    curves with an end on a row shared with a neighbouring band (the only ones that may need joining
+    to another band's), and the rest packed end to end into one (N,2) array with their lengths.
+    """
+    start, end = band
+    shared_rows = [row for row in (start, end - 1) if 0 < row < len(_worker_values) - 1]
+    segments = marching_squares(_worker_values[start:end], isovals, row_offset=start)
+    results = []
+    for value, band_segments in zip(isovals, segments):
+        curves = [c.to_array() for c in IsoLayer.from_segments(value, band_segments, compact=True).get_curves()]
+        end_rows = np.array([(c[0, 1], c[-1, 1]) for c in curves]).reshape(-1, 2)
+        on_boundary = np.isin(end_rows, shared_rows).any(axis=1).tolist()
+        boundary = [c for c, b in zip(curves, on_boundary) if b]
+        rest = [c for c, b in zip(curves, on_boundary) if not b]
+        points = np.concatenate(rest) if rest else np.empty((0, 2))
+        results.append((boundary, points, [len(c) for c in rest]))
+    return results
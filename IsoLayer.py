@@ -1,4 +1,59 @@
-from pjg_library.Path import Path
+import numpy as np
+from pjg_library.Path import Path, ArrayPath
+
+def _walk_ends(firsts, lasts):
+    """
+    Join pieces (segments or polylines) with the given (N,2) first and last points end to end.
+    The ends are numbered [firsts..., lasts...], so end k belongs to piece k % N, and they are
+    treated as a graph whose nodes are ends that match within tolerance (see IsoLayer.add_segments).
+    Returns the (2N,2) end points and a list of walks. Each walk is a list of end numbers:
+    the end the first piece is entered by, then the end each piece in turn is left by.
+    """
+    num_pieces = len(firsts)
+    ends = np.concatenate([firsts, lasts])
+    other = np.concatenate([np.arange(num_pieces, 2 * num_pieces), np.arange(num_pieces)])
+
+    # Nodes: ends quantized to tolerance-sized cells. Sort the ends by node, in piece order.
+    cells = np.floor(ends / Path.tolerance).astype(np.int64)
+    order = np.lexsort((cells[:, 1], cells[:, 0]))
+    sorted_cells = cells[order]
+    new_node = np.ones(len(order), dtype=bool)
+    new_node[1:] = np.any(sorted_cells[1:] != sorted_cells[:-1], axis=1)
+    group_start = np.maximum.accumulate(np.where(new_node, np.arange(len(order)), 0))
+    position = np.arange(len(order)) - group_start
+
+    # Pair consecutive ends at the same node: (0,1), (2,3), ...
+    paired = np.flatnonzero((position[:-1] % 2 == 0) & ~new_node[1:])
+    mate = np.full(len(order), -1)
+    mate[order[paired]] = order[paired + 1]
+    mate[order[paired + 1]] = order[paired]
+
+    other = other.tolist()
+    mate_list = mate.tolist()
+    used = [False] * num_pieces
+    walks = []
+
+    def walk(end):
+        sequence = [end]
+        while True:
+            used[end % num_pieces] = True
+            end = other[end]
+            sequence.append(end)
+            end = mate_list[end]
+            if end == -1 or used[end % num_pieces]:
+                return sequence
+
+    # Open curves start at unpaired ends, in piece order
+    open_ends = np.flatnonzero(mate == -1)
+    open_ends = open_ends[np.argsort(open_ends % num_pieces, kind='stable')]
+    for end in open_ends.tolist():
+        if not used[end % num_pieces]:
+            walks.append(walk(end))
+    # Everything left over is part of a closed loop
+    for piece in range(num_pieces):
+        if not used[piece]:
+            walks.append(walk(piece))
+    return ends, walks
 
 class IsoLayer:
     """
@@ -7,45 +62,202 @@ class IsoLayer:
     - Make interpolation optional, so you can keep things geometric if you want.
     """
 
-    def __init__(self,value):
+    def __init__(self,value,compact=False):
+        """
+        If compact is True, curves are stored as ArrayPaths, which are backed by NumPy buffers
+        and are much cheaper to grow when merging long contours.
+        """
         self.value = value
-        self.curves = []
+        self.path_class = ArrayPath if compact else Path
+        self._curves = {} # id -> Path, in insertion order
+        self._next_id = 0
+        # Endpoint index: quantized (x,y) cell -> set of ids of curves with an endpoint in that cell,
+        # or None when it needs rebuilding (see extend_paths)
+        self._endpoints = {}
+
+    @classmethod
+    def from_segments(cls, value, segments, compact=False):
+        """Create an IsoLayer for value from an (N,2,2) array of segments. See add_segments."""
+        iso = cls(value, compact)
+        iso.add_segments(segments)
+        return iso
+
+    @property
+    def curves(self):
+        """
+        A read-only tuple of the curves, so code that appends to it fails rather than losing the curve.
+        Use add_path to add a curve, or assign a new sequence to curves to replace them all.
+        """
+        return tuple(self._curves.values())
+
+    @curves.setter
+    def curves(self, curves):
+        self._curves = dict(enumerate(curves))
+        self._next_id = len(self._curves)
+        self.reindex()
 
     def get_curves(self):
+        """
+        A read-only tuple of the curves (see curves). The Paths themselves are shared, so if you change
+        their ends in place (e.g. with crop or shift), call reindex before adding more segments.
+        """
         return self.curves
 
+    def reindex(self):
+        """Rebuild the endpoint index, after curves have been changed in place."""
+        self._endpoints = {}
+        for curve_id, curve in self._curves.items():
+            self._index(curve_id, curve)
+
+    def _cell(self, point, tolerance):
+        return (int(point[0] // tolerance), int(point[1] // tolerance))
+
+    def _index(self, curve_id, curve):
+        for point in (curve.get_start(), curve.get_end()):
+            self._endpoints.setdefault(self._cell(point, curve.tolerance), set()).add(curve_id)
+
+    def _unindex(self, curve_id, curve):
+        for point in (curve.get_start(), curve.get_end()):
+            cell = self._cell(point, curve.tolerance)
+            ids = self._endpoints.get(cell)
+            if ids is not None:
+                ids.discard(curve_id)
+                if not ids:
+                    del self._endpoints[cell]
+
+    def _candidates(self, curve):
+        """
+        Ids of curves with an endpoint within tolerance of either end of curve, in insertion order.
+        Cells are tolerance-sized, so any point within tolerance is in one of the 9 neighbouring cells.
+        """
+        found = set()
+        for point in (curve.get_start(), curve.get_end()):
+            cx, cy = self._cell(point, curve.tolerance)
+            for dx in (-1, 0, 1):
+                for dy in (-1, 0, 1):
+                    ids = self._endpoints.get((cx + dx, cy + dy))
+                    if ids:
+                        found.update(ids)
+        return sorted(found)
+
     def add(self,start,end):
         """
         Given the start and end points of a segment, add that segment to this IsoLayer.
         If it matches the start or end of any existing paths, it will be appended to that path.
         Otherwise, it's added as a new path.
 
-        TODO:
-        Are there more efficient ways to merge the paths?
-        I'm currently checking the path compatibility twice for each join.
-        What if the ends of the paths were in a sort of quad tree, so we only check things that are likely to be close?
+        Curve endpoints are kept in a hash of tolerance-sized cells, so only curves that
+        end near the segment are checked for compatibility.
+        """
+        self.add_path(self.path_class(start,end))
+
+    def add_segments(self, segments):
+        """
+        Add an (N,2,2) array of segments, each a (start, end) pair of (x,y) points.
+        Rather than merging the segments one at a time like add, the segments are treated as
+        edges of a graph whose nodes are endpoints that match within tolerance.
+        At each node the incident segment ends are paired up (so a node of degree 4 joins two
+        pairs of segments, and a node of odd degree leaves one end open), then maximal polylines
+        are walked out in one pass: first from the open ends, then around the remaining loops.
+        Each polyline is then merged with the existing curves like a single segment would be.
+
+        Where only two segment ends meet (as for contours of noise), the curves are the same as adding
+        the segments one at a time with add, but not necessarily in the same order, orientation, or
+        (for loops) starting point, since those depend on the order the segments were merged in.
+        At nodes where three or more ends meet (e.g. contours through grid points that lie exactly on
+        the iso value, which also give zero-length segments), the pairing can differ from the joins add
+        would make, so the same segments may be split into a different number of curves.
+        Use add for add's order and joins.
+        """
+        segments = np.asarray(segments, dtype=float).reshape(-1, 2, 2)
+        num_segments = len(segments)
+        if num_segments == 0:
+            return
+
+        ends, walks = _walk_ends(segments[:, 0], segments[:, 1])
+        lengths = [len(w) for w in walks]
+        points = ends[np.concatenate(walks)]
+        if self.path_class is Path:
+            points = list(map(tuple, points.tolist()))
+        start = 0
+        for length in lengths:
+            self.add_path(self.path_class.from_points(points[start:start + length]))
+            start += length
+
+    def add_polylines(self, polylines):
         """
-        # Check if line is compatible with any others
-        curve = Path(start,end)
+        Add a list of (N,2) point arrays, joining them end to end in bulk the same way add_segments
+        joins segments, then merging each joined curve with the existing curves like add_path.
+        """
+        num_polylines = len(polylines)
+        if num_polylines == 0:
+            return
+        firsts = np.array([polyline[0] for polyline in polylines], dtype=float)
+        lasts = np.array([polyline[-1] for polyline in polylines], dtype=float)
+        for walk in _walk_ends(firsts, lasts)[1]:
+            # Each end after the first is the end a polyline is left by, so its last end means forwards
+            pieces = [polylines[walk[1] % num_polylines] if walk[1] >= num_polylines
+                      else polylines[walk[1] % num_polylines][::-1]]
+            for end in walk[2:]:
+                polyline = polylines[end % num_polylines]
+                pieces.append(polyline[1:] if end >= num_polylines else polyline[-2::-1])
+            points = np.concatenate(pieces)
+            if self.path_class is Path:
+                points = list(map(tuple, points.tolist()))
+            self.add_path(self.path_class.from_points(points))
+
+    def add_path(self, curve):
+        """Join curve onto the (up to two) existing curves it connects to, or add it as a new curve."""
+        if self._endpoints is None:
+            self.reindex()
         match_1 = -1
         match_2 = -1
-        for index,other in enumerate(self.curves):
-            compat = curve.get_compatibility(other)
+        for curve_id in self._candidates(curve):
+            compat = curve.get_compatibility(self._curves[curve_id])
             if compat != 0:
                 if match_1 == -1:
-                    match_1 = index
+                    match_1 = curve_id
                 else:
-                    match_2 = index
+                    match_2 = curve_id
                     break
-        
+
         if match_1 == -1:
             # No match, just add the curve
-            self.curves.append(curve)
+            self.insert_path(curve)
         else:
-            self.curves[match_1].add(curve)
+            first = self._curves[match_1]
+            self._unindex(match_1, first)
+            first.add(curve)
             if match_2 != -1:
-                self.curves[match_2].add(self.curves[match_1])
-                self.curves.pop(match_1)
+                # The curve bridges two existing curves
+                second = self._curves[match_2]
+                self._unindex(match_2, second)
+                second.add(first)
+                del self._curves[match_1]
+                self._index(match_2, second)
+            else:
+                self._index(match_1, first)
+
+    def insert_path(self, curve):
+        """
+        Add curve as a new curve without looking for curves to join it to.
+        Only use this for curves whose ends are known not to meet any existing curve.
+        """
+        if self._endpoints is None:
+            self.reindex()
+        self._curves[self._next_id] = curve
+        self._index(self._next_id, curve)
+        self._next_id += 1
+
+    def extend_paths(self, curves):
+        """
+        Add a sequence of curves as new curves, like insert_path, without indexing their ends.
+        The index is rebuilt the next time a curve is added, so adding many curves that nothing
+        will join to (as get_topography_values does) costs little unless more are added later.
+        """
+        self._curves.update(zip(range(self._next_id, self._next_id + len(curves)), curves))
+        self._next_id += len(curves)
+        self._endpoints = None
 
     def marching_squares(self, row, col, topleft, topright, botleft, botright):
         """
@@ -1,4 +1,6 @@
 import random
+import numpy as np
+from shapely.geometry import LineString
 
 class Path:
     """
@@ -17,9 +19,36 @@ class Path:
     add should be called merge
 
     """
+    tolerance = 0.00001
+
     def __init__(self,start,end):
         self.points = [start,end]
-        self.tolerance = 0.00001
+        self.tolerance = Path.tolerance
+
+    @classmethod
+    def from_points(cls, points):
+        """Create a Path from a sequence of two or more points."""
+        path = cls(points[0], points[-1])
+        path.points = list(points)
+        return path
+
+    @classmethod
+    def from_packed(cls, points, lengths):
+        """Create a list of Paths from an (N,2) array of their points end to end, and the number of points in each."""
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        paths = []
+        start = 0
+        for length in lengths:
+            paths.append(cls.from_points(list(map(tuple, points[start:start + length].tolist()))))
+            start += length
+        return paths
+
+    def to_array(self):
+        """Return the points as an (N,2) NumPy array."""
+        return np.array(self.points, dtype=float)
+
+    def to_linestring(self):
+        return LineString(self.to_array())
 
     def get_start(self):
         return self.points[0]
@@ -136,3 +165,170 @@ class Path:
         else:
             self.points = self.points[0:len(self.points)-crop_num]
 
+
+class ArrayPath:
+    """
+    A compact Path whose points live in a growable (capacity,2) NumPy buffer.
+    The points occupy buffer[head:tail], with free space kept on both sides,
+    so add() can prepend or append another path in amortized O(1) per point
+    instead of rebuilding a list of tuples every time.
+    crop() only moves head/tail, and to_array() returns a view of the buffer.
+
+    It has the same interface as Path, so IsoLayer can build either (see IsoLayer's compact option).
+    The points property builds a list of tuples, so avoid it on hot paths.
+    """
+    __slots__ = ('_buffer', '_head', '_tail', 'tolerance')
+
+    def __init__(self,start,end):
+        self._buffer = np.empty((8, 2))
+        self._head = 3
+        self._tail = 5
+        self._buffer[3] = start
+        self._buffer[4] = end
+        self.tolerance = Path.tolerance
+
+    @classmethod
+    def from_points(cls, points):
+        """Create an ArrayPath from a sequence or (N,2) array of two or more points."""
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        path = cls.__new__(cls)
+        num_points = len(points)
+        path._buffer = np.empty((max(8, 2 * num_points), 2))
+        path._head = (len(path._buffer) - num_points) // 2
+        path._tail = path._head + num_points
+        path._buffer[path._head:path._tail] = points
+        path.tolerance = Path.tolerance
+        return path
+
+    @classmethod
+    def from_packed(cls, points, lengths):
+        """
+        Create a list of ArrayPaths from an (N,2) array of their points end to end, and the number
+        of points in each. The buffers are slices of one allocation, each with its own spare room on
+        both sides, so this makes one copy of the points rather than one per path.
+        """
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        lengths = np.asarray(lengths, dtype=np.int64)
+        capacity = np.maximum(8, 2 * lengths)
+        buffer_end = np.cumsum(capacity)
+        buffer_start = buffer_end - capacity
+        head = (capacity - lengths) // 2
+        buffer = np.empty((int(buffer_end[-1]) if len(lengths) else 0, 2))
+        first = np.cumsum(lengths) - lengths
+        buffer[np.repeat(buffer_start + head - first, lengths) + np.arange(len(points))] = points
+        paths = []
+        for start, end, path_head, length in zip(buffer_start.tolist(), buffer_end.tolist(),
+                                                 head.tolist(), lengths.tolist()):
+            path = cls.__new__(cls)
+            path._buffer = buffer[start:end]
+            path._head = path_head
+            path._tail = path_head + length
+            path.tolerance = Path.tolerance
+            paths.append(path)
+        return paths
+
+    def __len__(self):
+        return self._tail - self._head
+
+    @property
+    def points(self):
+        return list(map(tuple, self.to_array().tolist()))
+
+    @points.setter
+    def points(self, points):
+        other = ArrayPath.from_points(points)
+        self._buffer = other._buffer
+        self._head = other._head
+        self._tail = other._tail
+
+    def to_array(self):
+        """Return the points as an (N,2) array. This is a view of the buffer, not a copy."""
+        return self._buffer[self._head:self._tail]
+
+    def to_linestring(self):
+        return LineString(self.to_array())
+
+    def get_start(self):
+        return tuple(self._buffer[self._head].tolist())
+
+    def get_end(self):
+        return tuple(self._buffer[self._tail - 1].tolist())
+
+    def _reserve(self, front, back):
+        """Make sure there is room for front points before head and back points after tail."""
+        if self._head >= front and len(self._buffer) - self._tail >= back:
+            return
+        num_points = len(self)
+        # Double the capacity, leaving the spare room split between both ends
+        capacity = 2 * (num_points + front + back) + 8
+        buffer = np.empty((capacity, 2))
+        head = front + (capacity - num_points - front - back) // 2
+        buffer[head:head + num_points] = self.to_array()
+        self._buffer = buffer
+        self._head = head
+        self._tail = head + num_points
+
+    def _prepend(self, points):
+        self._reserve(len(points), 0)
+        self._buffer[self._head - len(points):self._head] = points
+        self._head -= len(points)
+
+    def _append(self, points):
+        self._reserve(0, len(points))
+        self._buffer[self._tail:self._tail + len(points)] = points
+        self._tail += len(points)
+
+    def add(self,other):
+        compatible = self.get_compatibility(other)
+        if compatible == 0:
+            # Paths are not compatible.
+            return 0
+
+        if isinstance(other, ArrayPath):
+            points = other.to_array()
+        else:
+            points = np.asarray(other.points, dtype=float)
+
+        if compatible == 1:
+            # start and other end are the same. Put other at the start, without its end
+            self._prepend(points[:-1])
+        elif compatible == 2:
+            # end and other start are the same. Place other at the end, without its start
+            self._append(points[1:])
+        elif compatible == 3:
+            # same start points, reverse the other, don't include its start, and add to self
+            self._prepend(points[:0:-1])
+        elif compatible == 4:
+            # same end points, reverse the other, don't include its end, add to self
+            self._append(points[-2::-1])
+
+    get_compatibility = Path.get_compatibility
+    is_loop = Path.is_loop
+
+    def shift(self, percentage=None):
+        """
+        Randomly shifts the order of points, to offset the start point.
+        Doesn't check that this is a loop, so you can use this at your own peril.
+        The points are rotated in place within the buffer.
+        """
+        num_points = len(self)
+        if percentage is None:
+            percentage = random.random()
+        new_start = int( percentage * num_points % num_points)
+        view = self.to_array()
+        view[:] = np.roll(view, -new_start, axis=0)
+
+    def crop(self, percentage = None, from_start = True):
+        """Same as Path.crop, but only moves the ends of the view into the buffer."""
+        if self.is_loop():
+            self.shift()
+        if percentage is None:
+            percentage = random.random() * 0.5
+        crop_num = int(percentage * len(self))
+        if percentage >= 1.0:
+            self._tail = self._head + 1
+            return
+        if from_start:
+            self._head += crop_num
+        else:
+            self._tail -= crop_num
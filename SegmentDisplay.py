@@ -1,7 +1,50 @@
 from .SegmentCodes import *
 from .SegmentLines import *
+from collections import OrderedDict
+import numpy as np
+import shapely
 from shapely.geometry import Polygon,GeometryCollection,LineString
 from shapely.ops import polygonize_full,linemerge,unary_union
+from shapely.affinity import translate
+
+class GlyphCache:
+    """
+    LRU cache of unioned glyph geometry, drawn at the origin, keyed on
+    (segment bitmask, display style, charwidth, charheight).
+    Keying on the bitmask rather than the character lets characters with the same segments
+    (and displays with different code tables) share glyphs.
+    The style is keyed by identity, and each entry keeps a reference to its style so the id can't be reused;
+    if a style dict is modified in place, call clear().
+    """
+    def __init__(self,maxsize=1024):
+        self.maxsize = maxsize
+        self._glyphs = OrderedDict()
+
+    def get(self,mask,style,charwidth,charheight):
+        key = (mask, id(style), charwidth, charheight)
+        entry = self._glyphs.get(key)
+        if entry is not None:
+            self._glyphs.move_to_end(key)
+            return entry[1]
+        polygons = []
+        for index in range(15):
+            if mask >> index & 1:
+                polygons.append(Polygon([[x*charwidth, y*charheight] for x,y in style[index]]))
+        glyph = unary_union(polygons)
+        self._glyphs[key] = (style, glyph)
+        if len(self._glyphs) > self.maxsize:
+            self._glyphs.popitem(last=False)
+        return glyph
+
+    def clear(self):
+        self._glyphs.clear()
+
+    def __len__(self):
+        return len(self._glyphs)
+
+# Shared by all displays, so the same glyphs are only built once however many displays there are
+glyph_cache = GlyphCache()
+
 class SegmentDisplay:
     """
     TODO:
@@ -41,6 +84,12 @@ class SegmentDisplay:
         self.wrap = wrap
         self.halign = halign
         self.valign = valign
+        self.glyphs = glyph_cache
+        self._code_table = None # (codes, bitmask per code point) for get_packed_segments
+        self._style_table = None # (style, packed points, offsets) for get_packed_segments
+        self._unions = None # get_unions output in text order, reused for cells that haven't changed
+        self._layout = None # Everything besides the text that _unions depends on
+        self._dirty = set() # (line, char) of cells changed by setText since _unions was built
 
     def get_position(self):
         """Get the x,y coordinates of the top left of the display."""
@@ -63,11 +112,13 @@ class SegmentDisplay:
         return (x,y)
 
     def addColumns(self,numColumns=1):
+        self._unions = None
         for line in self.text:
             for column in range(numColumns):
                 line.append(' ')
 
     def addRows(self,numRows=1):
+        self._unions = None
         for row in range(numRows):
             self.text.append([' ' for c in range(len(self.text[0]))])
     
@@ -103,6 +154,8 @@ class SegmentDisplay:
                         # fixed width, can't wrap, position is invalid.
                         return
                 # Position is valid
+                if self.text[pos[0]][pos[1]] != c:
+                    self._dirty.add((pos[0], pos[1]))
                 self.text[pos[0]][pos[1]] = c
                 pos[1] += 1
 
@@ -122,6 +175,7 @@ class SegmentDisplay:
         return self.charsperline * (self.charwidth + self.spacing)
 
     def scale(self, scale):
+        self._unions = None
         self.charheight = self.charheight*scale
         self.charwidth = self.charwidth*scale
         self.spacing = self.spacing*scale
@@ -164,42 +218,110 @@ class SegmentDisplay:
         return self.codes[character]
 
     def get_unions(self):
-        """Merges segments in each letter into fewer polygons to reduce overlapping elements."""
-        segments = self.get_segments()
-        unions = []
-        for letter in segments:
-            polygons = []
-            for segment in letter:
-                polygons.append(Polygon(segment))
-            unions.append(unary_union(polygons))
-        return unions
+        """Merges segments in each letter into fewer polygons to reduce overlapping elements.
+        Each glyph is unioned once per style and size (see GlyphCache) and translated into place.
+        The result is kept, and later calls only redo the cells changed by setText since;
+        move, scale, adding rows or columns, or any other change to the layout redoes every cell.
+        Change the text through setText, since edits made directly to self.text aren't tracked."""
+        position = self.get_position()
+        layout = (position, self.charwidth, self.charheight, self.spacing, self.display_style, self.codes,
+                  tuple(len(line) for line in self.text))
+        if self._unions is None or layout != self._layout:
+            self._unions = []
+            for lineindex, line in enumerate(self.text):
+                for charindex, char in enumerate(line):
+                    self._unions.append(self.get_character_union(char, lineindex, charindex, position))
+            self._layout = layout
+        else:
+            first = np.cumsum([0] + [len(line) for line in self.text])
+            for lineindex, charindex in self._dirty:
+                char = self.text[lineindex][charindex]
+                self._unions[first[lineindex] + charindex] = self.get_character_union(char, lineindex, charindex, position)
+        self._dirty = set()
+        return list(self._unions)
+
+    def get_character_union(self,character,lineindex,charindex,position=None):
+        """The unioned glyph of one character, in place. position is get_position(), if already known."""
+        if position is None:
+            position = self.get_position()
+        x = position[0] + (self.charwidth + self.spacing) * charindex + self.spacing
+        y = position[1] + (self.charheight + self.spacing) * lineindex + self.spacing
+        glyph = self.glyphs.get(self.get_hex(character), self.display_style, self.charwidth, self.charheight)
+        return translate(glyph, x, y)
+
+    def get_masks(self):
+        """Return the line index, character index and segment bitmask of every character, in text order.
+        The bitmasks are looked up all at once from a table of self.codes indexed by code point."""
+        if self._code_table is None or self._code_table[0] is not self.codes:
+            table = np.full(max(map(ord, self.codes)) + 1, -1, dtype=np.int64)
+            for character, code in self.codes.items():
+                table[ord(character)] = code
+            self._code_table = (self.codes, table)
+        table = self._code_table[1]
+        chars = [ord(c) for line in self.text for c in line]
+        lineindex = np.repeat(np.arange(len(self.text)), [len(line) for line in self.text])
+        charindex = np.concatenate([np.arange(len(line)) for line in self.text]) if self.text else np.empty(0, dtype=int)
+        codepoints = np.array(chars, dtype=np.int64)
+        unknown = codepoints >= len(table)
+        masks = table[np.where(unknown, 0, codepoints)]
+        unknown |= masks < 0
+        if unknown.any():
+            raise KeyError(chr(codepoints[np.argmax(unknown)]))
+        return lineindex, charindex, masks
+
+    def get_packed_segments(self):
+        """Lay out every segment of every character at once.
+        Returns an (N,2) array of all the segment points, the offsets where each segment starts
+        (segment i is points[offsets[i]:offsets[i+1]]), and the index of the character each segment belongs to
+        (counting through the text line by line). Segments are in the same order as get_segments."""
+        if self._style_table is None or self._style_table[0] is not self.display_style:
+            base = [np.asarray(self.display_style[i], dtype=float) for i in range(15)]
+            sizes = np.array([len(b) for b in base])
+            self._style_table = (self.display_style, np.concatenate(base), np.concatenate([[0], np.cumsum(sizes)]))
+        _, base, base_offsets = self._style_table
+
+        lineindex, charindex, masks = self.get_masks()
+        lit = (masks[:, None] >> np.arange(15)) & 1 == 1
+        cell, segment = np.nonzero(lit)
+        sizes = base_offsets[segment + 1] - base_offsets[segment]
+        offsets = np.concatenate([[0], np.cumsum(sizes)])
+        point = np.arange(offsets[-1]) - np.repeat(offsets[:-1], sizes) + np.repeat(base_offsets[segment], sizes)
+
+        position = self.get_position()
+        xoffset = (self.charwidth + self.spacing) * charindex.astype(float) + self.spacing
+        yoffset = (self.charheight + self.spacing) * lineindex.astype(float) + self.spacing
+        pointcell = np.repeat(cell, sizes)
+        points = np.empty((len(point), 2))
+        points[:, 0] = base[point, 0]*self.charwidth + position[0] + xoffset[pointcell]
+        points[:, 1] = base[point, 1]*self.charheight + position[1] + yoffset[pointcell]
+        return points, offsets, cell
+
+    def _packed_geoms(self):
+        """Every segment as a Polygon (or LineString if it has fewer than 3 points), and its character index."""
+        points, offsets, cell = self.get_packed_segments()
+        sizes = np.diff(offsets)
+        index = np.repeat(np.arange(len(sizes)), sizes)
+        geoms = np.empty(len(sizes), dtype=object)
+        polygon = sizes >= 3
+        if polygon.any():
+            keep = polygon[index]
+            geoms[polygon] = shapely.polygons(shapely.linearrings(points[keep], indices=index[keep]))
+        if not polygon.all():
+            keep = ~polygon[index]
+            geoms[~polygon] = shapely.linestrings(points[keep], indices=index[keep])
+        return geoms, cell
 
     def get_geom_collection(self):
-        segments = self.get_segments()
-        multipolys = []
-        for letter in segments:
-            for segment in letter:
-                if len(segment) < 3:
-                    multipolys.append(LineString(segment))
-                else:
-                    poly = Polygon(segment)
-                    multipolys.append(poly)
-
-        return  GeometryCollection(multipolys)
+        geoms, _ = self._packed_geoms()
+        return GeometryCollection(list(geoms))
 
     def get_array_geom_collection(self):
-        segments = self.get_segments()
-        geoms = []
-        for letter in segments:
-            multipolys = []
-            for segment in letter:
-                poly = Polygon(segment)
-                multipolys.append(poly)
-            geoms.append(GeometryCollection(multipolys))
-
-        return geoms
+        geoms, cell = self._packed_geoms()
+        first = np.searchsorted(cell, np.arange(sum(len(line) for line in self.text) + 1))
+        return [GeometryCollection(list(geoms[a:b])) for a, b in zip(first[:-1], first[1:])]
 
     def move(self,x,y):
+        self._unions = None
         self.x = x
         self.y = y
 
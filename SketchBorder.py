@@ -1,4 +1,6 @@
+from collections import OrderedDict
 from shapely.geometry import Polygon,GeometryCollection
+import shapely
 from .SegmentDisplay import *
 import datetime
 """
@@ -14,19 +16,39 @@ that is a buffer length away from the edge.
 You can call get_frame to get a Polygon representing the actual paper size, for cutting a larger
 piece down to size.
 
+The geometry is only built when first asked for, and cached for every SketchBorder with the same
+edges and stamp (and for get_text, the same seed and date), so a seed sweep builds the frame,
+border and bound once. The bound is prepared, so cropping against it is fast.
 """
 
+# Geometry shared by all SketchBorders: (name, key) -> (kept, geometry), least recently used first
+_geometry_cache = OrderedDict()
+_geometry_cache_size = 256
+
+def _cached(name, key, build, keep=()):
+    """
+    Return the geometry cached under (name, key), building and caching it if needed.
+    keep holds any objects the key refers to by id, as in GlyphCache: the entry keeps a reference
+    to them, so their ids can't be reused by other objects while the entry is cached.
+    """
+    key = (name,) + key
+    entry = _geometry_cache.get(key)
+    if entry is not None:
+        _geometry_cache.move_to_end(key)
+        return entry[1]
+    geometry = build()
+    _geometry_cache[key] = (keep, geometry)
+    if len(_geometry_cache) > _geometry_cache_size:
+        _geometry_cache.popitem(last=False)
+    return geometry
+
 class SketchBorder:
     def __init__(self,width,height,seed=0,buffer=1.0):
-        self.width = width
-        self.height = height
+        self._width = width
+        self._height = height
         self.seed = seed
-        self.buffer = buffer 
-
-        self.top = 0 - self.height/2.0 + self.buffer
-        self.bottom = self.height/2.0 - self.buffer
-        self.left = 0 - self.width/2.0 + self.buffer
-        self.right = self.width/2.0 - self.buffer
+        self._buffer = buffer 
+        self._set_edges()
 
         self.charheight = 0.5
 
@@ -40,8 +62,63 @@ class SketchBorder:
                                       valign='bottom')
         #display.x = display.x + display.spacing
 
+    def _set_edges(self):
+        self.top = 0 - self.height/2.0 + self.buffer
+        self.bottom = self.height/2.0 - self.buffer
+        self.left = 0 - self.width/2.0 + self.buffer
+        self.right = self.width/2.0 - self.buffer
+
+    def _resize(self, width, height, buffer):
+        """Change the size, recomputing the edges. The stamp follows the bottom left corner,
+        unless it has been moved somewhere else."""
+        corner = (self.left, self.bottom)
+        self._width, self._height, self._buffer = width, height, buffer
+        self._set_edges()
+        if (self.display.x, self.display.y) == corner:
+            self.display.move(self.left, self.bottom)
+
+    @property
+    def width(self):
+        return self._width
+
+    @width.setter
+    def width(self, width):
+        self._resize(width, self.height, self.buffer)
+
+    @property
+    def height(self):
+        return self._height
+
+    @height.setter
+    def height(self, height):
+        self._resize(self.width, height, self.buffer)
+
+    @property
+    def buffer(self):
+        return self._buffer
+
+    @buffer.setter
+    def buffer(self, buffer):
+        self._resize(self.width, self.height, buffer)
+
+    def _stamp_key(self):
+        """Everything about the stamp display that the bound and text depend on.
+        The style and code table are keyed by identity; see _stamp_objects."""
+        d = self.display
+        return (d.x, d.y, d.halign, d.valign, d.charwidth, d.charheight, d.spacing, d.getwidth(),
+                id(d.display_style), id(d.codes))
+
+    def _stamp_objects(self):
+        """The objects _stamp_key refers to by id, for the cache entry to keep alive."""
+        return (self.display.display_style, self.display.codes)
+
     def get_bound(self):
-        """Returns a Shapely Polygon bound for the drawing, so it may avoid intersecting the text."""
+        """Returns a Shapely Polygon bound for the drawing, so it may avoid intersecting the text.
+        The bound is prepared, for fast repeated contains/intersects tests and cropping."""
+        key = (self.top, self.bottom, self.left, self.right) + self._stamp_key()
+        return _cached('bound', key, self._build_bound, self._stamp_objects())
+
+    def _build_bound(self):
         top = self.top
         bottom = self.bottom
         left = self.left
@@ -54,9 +131,13 @@ class SketchBorder:
         nametop = self.display.y - s
 
         bound = Polygon([(left,top),(right,top),(right,bottom),(stampright,bottom),(stampright,stamptop),(nameright,stamptop),(nameright,nametop),(left,nametop)])
+        shapely.prepare(bound)
         return bound
         
     def get_frame(self):
+        return _cached('frame', (self.width, self.height), self._build_frame)
+
+    def _build_frame(self):
         t = 0-self.height/2.0
         b = self.height/2.0
         l = 0-self.width/2.0
@@ -66,6 +147,9 @@ class SketchBorder:
 
     def get_border(self):
         """Return a shapely Polygon of the border"""
+        return _cached('border', (self.top, self.bottom, self.left, self.right), self._build_border)
+
+    def _build_border(self):
         top = self.top
         bottom = self.bottom
         left = self.left
@@ -87,4 +171,7 @@ class SketchBorder:
         seedstring = f"{self.seed:#0{10}X}"
         datestring = datetime.date.today().strftime("%Y-%m-%d")
         text = "GARRISON OSTEEN\n" + datestring + " " + seedstring
-        return self.display.display(text)
+        # Setting the text is cheap, and keeps the display showing it even when the geometry is cached
+        self.display.setText(text)
+        key = self._stamp_key() + (tuple(''.join(line) for line in self.display.text),)
+        return _cached('text', key, self.display.display, self._stamp_objects())
@@ -0,0 +1,44 @@
+import tempfile
+import numpy as np
+from pjg_library.HeightMap import HeightMap
+
+class TiledHeightMap(HeightMap):
+    """
+    A HeightMap whose values live in a np.memmap file rather than in RAM,
+    for maps that are too big to hold in memory (20k x 20k and up).
+    The map is processed in tiles of tile_rows full rows, so generation only ever holds
+    one tile's worth of temporary arrays, and contouring reads a bounded band of rows at a time.
+    Contours are stitched across tile seams exactly as they would be in memory,
+    so get_topography returns the same IsoLayers as a HeightMap with the same values.
+
+    If no filename is given, the values are stored in a temporary file that is deleted with the map.
+    Use mode='r+' to reopen an existing map file.
+    """
+    def __init__(self,rows,cols=0,tile_rows=256,filename=None,mode='w+'):
+        self.rows = rows
+        self.cols = rows
+        if cols != 0:
+            self.cols = cols
+        self.tile_rows = tile_rows
+        self.filename = filename
+        if filename is None:
+            self._file = tempfile.NamedTemporaryFile(suffix='.heightmap')
+            storage = self._file.name
+        else:
+            storage = filename
+        self.values = np.memmap(storage, dtype=np.float64, mode=mode, shape=(self.rows, self.cols))
+
+    def _new_values(self):
+        # Generate in place, tile by tile
+        return self.values
+
+    def _bands(self, band_rows):
+        return super()._bands(min(band_rows, self.tile_rows))
+
+    def average(self, other):
+        for rows in self._bands(self.rows):
+            self.values[rows] = (self.values[rows] + other.values[rows]) / 2.0
+
+    def flush(self):
+        """Write any changes to the map file."""
+        self.values.flush()
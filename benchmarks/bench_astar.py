@@ -0,0 +1,49 @@
+# Benchmark: HeightMap.astar across large maps
+# Run from the directory containing pjg_library: python -m pjg_library.benchmarks.bench_astar [size]
+# With the default (optimal) settings the search expands most of a rough map, so it's the slowest
+# line here. Only weighted A* is sub-second on multi-megacell maps, at the price of costlier paths.
+import math
+import random
+import sys
+import time
+from pjg_library.HeightMap import HeightMap, slope_cost
+
+def timed(f, *args, **kwargs):
+    start = time.perf_counter()
+    result = f(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+def path_cost(heightmap, path, cost):
+    """Total cost of path, with cost as passed to astar."""
+    total = 0.0
+    for (x0, y0), (x1, y1) in zip(path.points, path.points[1:]):
+        total += cost(heightmap.values[int(y0)][int(x0)], heightmap.values[int(y1)][int(x1)],
+                      math.hypot(x1 - x0, y1 - y0))
+    return total
+
+def bench(size):
+    corner = (10, 10)
+    opposite = (size - 10, size - 10)
+    cost = slope_cost()
+    print(f"{size}x{size} ({size*size/1e6:.1f} megacells), corner to corner")
+
+    flat = HeightMap(size, size)
+    path, t = timed(flat.astar, corner, opposite)
+    print(f"  flat map, defaults:                {t:8.3f}s, {len(path.points)} points")
+
+    random.seed(0)
+    terrain = HeightMap(size, size)
+    terrain.randomize(backend='numpy')
+    path, t = timed(terrain.astar, corner, opposite)
+    optimal = path_cost(terrain, path, cost)
+    print(f"  noise, defaults (optimal):         {t:8.3f}s, {len(path.points)} points, cost {optimal:.1f}")
+    print("  weighted A* (not the default, paths may cost more):")
+    for weight in (1.5, 2.0):
+        path, t = timed(terrain.astar, corner, opposite, heuristic_weight=weight)
+        extra = path_cost(terrain, path, cost) / optimal - 1.0
+        print(f"    noise, heuristic_weight={weight}:     {t:8.3f}s, {len(path.points)} points, cost +{extra:.1%}")
+    path, t = timed(terrain.astar, corner, opposite, connectivity=4, heuristic_weight=1.5)
+    print(f"    noise, 4-connected, weight=1.5:  {t:8.3f}s, {len(path.points)} points")
+
+if __name__ == '__main__':
+    bench(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
@@ -0,0 +1,36 @@
+# Benchmark: diffract with many lenses
+# Run from the directory containing pjg_library: python -m pjg_library.benchmarks.bench_diffraction [lenses] [rays]
+import random
+import sys
+import time
+from shapely.geometry import LineString
+from pjg_library.diffraction import diffract
+from pjg_library.bezierUtilities import bezier_to_linestring, random_bezier
+
+def timed(f, *args, **kwargs):
+    start = time.perf_counter()
+    result = f(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+def bench(num_lenses, rays):
+    random.seed(0)
+    lenses = []
+    for _ in range(num_lenses):
+        x, y = random.uniform(-400, 400), random.uniform(-400, 400)
+        curve = bezier_to_linestring(random_bezier(20))
+        lenses.append(LineString([(px + x, py + y) for px, py in curve.coords]))
+    source = LineString([(-500, -500), (500, -500)])
+    dest = LineString([(500, 500), (-500, 500)])
+    print(f"{num_lenses} lenses ({sum(len(l.coords) for l in lenses)} points), {rays} rays")
+
+    layers, t = timed(diffract, source, dest, lenses, rays, vectorized=False)
+    print(f"  shapely, one ray at a time:  {t:8.3f}s, {sum(map(len, layers))} pieces")
+    layers, t = timed(diffract, source, dest, lenses, rays)
+    print(f"  vectorized, STRtree:         {t:8.3f}s, {sum(map(len, layers))} pieces")
+    for workers in (2, 4):
+        layers, t = timed(diffract, source, dest, lenses, rays, workers=workers)
+        print(f"  vectorized, {workers} workers:        {t:8.3f}s, {sum(map(len, layers))} pieces")
+
+if __name__ == '__main__':
+    bench(int(sys.argv[1]) if len(sys.argv) > 1 else 500,
+          int(sys.argv[2]) if len(sys.argv) > 2 else 5000)
@@ -0,0 +1,102 @@
+# Benchmark: per-cell vs vectorized marching squares for HeightMap.get_topography
+# Run from the directory containing pjg_library: python -m pjg_library.benchmarks.bench_topography [size] [isos] [workers]
+import os
+import random
+import sys
+import time
+from collections import Counter
+from pjg_library.HeightMap import HeightMap
+from pjg_library.marchingSquares import marching_squares
+import numpy as np
+
+def timed(f, *args, **kwargs):
+    start = time.perf_counter()
+    result = f(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+def canonical(curves, decimals=9):
+    """
+    The curves as a sorted list of point tuples, ignoring the order of the curves, their orientation,
+    and where each loop starts, which differ between the per-cell and vectorized paths.
+    """
+    result = []
+    for curve in curves:
+        points = [tuple(p) for p in np.round(np.asarray(curve.points, dtype=float), decimals).tolist()]
+        if len(points) > 2 and points[0] == points[-1]:
+            loop = points[:-1]
+            start = loop.index(min(loop))
+            forward = loop[start:] + loop[:start]
+            backward = [forward[0]] + forward[1:][::-1]
+            points = min(forward, backward) + [forward[0]]
+        else:
+            points = min(points, points[::-1])
+        result.append(tuple(points))
+    return sorted(result)
+
+def segments(curves, decimals=9):
+    """The curves' non-degenerate segments, each as a sorted pair of points, with their counts."""
+    result = Counter()
+    for curve in curves:
+        points = [tuple(p) for p in np.round(np.asarray(curve.points, dtype=float), decimals).tolist()]
+        for start, end in zip(points, points[1:]):
+            if start != end:
+                result[min(start, end), max(start, end)] += 1
+    return result
+
+def check_exact_levels(trials=50, rows=70, cols=15):
+    """
+    Regression check for integer grids (like flow_direction's), where grid values sit exactly on
+    the iso value and three or more segment ends meet at a grid point. The per-cell, vectorized
+    and parallel paths may split the contours into different curves there, but must cover the
+    same segments. Off the grid values (iso 0.5), the curves themselves must match.
+    With 70 rows, the parallel path splits the grid into three bands, so their joins are checked too.
+    """
+    rng = np.random.default_rng(0)
+    for _ in range(trials):
+        h = HeightMap(rows, cols)
+        h.values = rng.integers(-2, 3, (rows, cols)).astype(float)
+        for value, compare in ((0.0, segments), (0.5, canonical)):
+            layers = [h.get_isolayer(value, vectorized=False), h.get_isolayer(value),
+                      h.get_topography_values([value], workers=3)[0]]
+            reference = compare(layers[0].get_curves())
+            assert all(compare(iso.get_curves()) == reference for iso in layers[1:]), (value, h.values)
+    print(f"integer grids: same segments at exact levels, same curves otherwise ({trials} trials)")
+
+def bench(size, num_isos, per_cell=True):
+    random.seed(0)
+    h = HeightMap(size, size)
+    h.gaussian(sigma=0.8)
+    isovals = np.linspace(0.0, 1.0, num_isos + 2)[1:-1]
+    print(f"{size}x{size}, {num_isos} isos")
+    _, t = timed(marching_squares, h.values, isovals)
+    print(f"  segments only (vectorized): {t:8.3f}s")
+    vec, t = timed(h.get_topography, num_isos=num_isos)
+    print(f"  get_topography (vectorized): {t:8.3f}s")
+    if per_cell:
+        ref, t = timed(h.get_topography, num_isos=num_isos, vectorized=False)
+        print(f"  get_topography (per-cell):   {t:8.3f}s")
+        same = all(canonical(a.get_curves()) == canonical(b.get_curves()) for a, b in zip(ref, vec))
+        print(f"  same curves (ignoring order and orientation): {same}")
+
+def bench_workers(size, num_isos, workers):
+    """Serial vs process pool get_topography_values, for Paths and compact ArrayPaths."""
+    random.seed(0)
+    h = HeightMap(size, size)
+    h.randomize(backend='numpy')
+    isovals = np.linspace(0.0, 1.0, num_isos + 2)[1:-1]
+    print(f"{size}x{size}, {num_isos} isos, {workers} workers ({os.cpu_count()} CPUs)")
+    for compact in (False, True):
+        serial, t_serial = timed(h.get_topography_values, isovals, compact=compact)
+        parallel, t_parallel = timed(h.get_topography_values, isovals, compact=compact, workers=workers)
+        same = all(canonical(a.get_curves()) == canonical(b.get_curves()) for a, b in zip(serial, parallel))
+        print(f"  compact={compact!s:5}: serial {t_serial:8.3f}s, workers {t_parallel:8.3f}s, "
+              f"speedup {t_serial / t_parallel:5.2f}x, same curves: {same}")
+
+if __name__ == '__main__':
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    num_isos = int(sys.argv[2]) if len(sys.argv) > 2 else 30
+    workers = int(sys.argv[3]) if len(sys.argv) > 3 else 0
+    check_exact_levels()
+    bench(size, num_isos)
+    if workers > 1:
+        bench_workers(size, num_isos, workers)
@@ -1,29 +1,120 @@
 # Bezier Utilities
 import random
+from functools import lru_cache
+from math import comb
 import numpy as np
 import bezier
+import shapely
 from shapely.geometry import LineString, Point
 
-def bezier_to_linestring(b, granularity = 0.01):
-    """Takes a Bezier curve object and converts it to a Shapely LineString."""
-    points = []
+# Highest degree evaluated with the NumPy kernel; anything above goes through bezier.Curve
+MAX_KERNEL_DEGREE = 3
 
-    for t in np.arange(0,1,granularity):
-        p = b.evaluate(t)
-        x = p[0][0]
-        y = p[1][0]
-        points.append([x,y])
+def bezier_to_linestring(b, granularity = 0.01, tolerance = None):
+    """Takes a Bezier curve object and converts it to a Shapely LineString.
+    b can also be an (n+1,2) array of control points, which is evaluated with the NumPy kernel
+    (see evaluate_beziers) up to degree MAX_KERNEL_DEGREE, without creating a bezier.Curve.
+    By default the curve is evaluated at every multiple of granularity, plus exactly 1.0 so the line
+    reaches the end of the curve, all in one call.
+    If tolerance is given, the curve is flattened adaptively instead (see flatten_nodes):
+    no point of the curve is further than tolerance from the line, so gentle curves get few points
+    and sharp bends get many."""
+    if tolerance is not None:
+        return LineString(flatten_nodes(_nodes(b), tolerance))
+    if isinstance(b, bezier.Curve):
+        return LineString(b.evaluate_multi(_parameters(granularity)).T)
+    nodes = np.asarray(b, dtype=float)
+    if len(nodes) - 1 > MAX_KERNEL_DEGREE:
+        return LineString(bezier.Curve.from_nodes(nodes.T).evaluate_multi(_parameters(granularity)).T)
+    return LineString(np.matmul(_sample_weights(len(nodes) - 1, granularity), nodes))
 
-    # Feels bad, but sometimes it doesn't get all the way to one, so I'm evaluating again to make sure it hits the exact end of the curve. Surely there's a better way to do this?
-    p = b.evaluate(1.0)
-    x = p[0][0]
-    y = p[1][0]
-    points.append([x,y])
+def beziers_to_linestrings(nodes, granularity = 0.01, as_array = False):
+    """Flatten M Bezier curves at once, given as an (M,n+1,2) array of control points.
+    Each curve is evaluated at the same parameters as bezier_to_linestring.
+    Returns an (M,T,2) array of points if as_array, otherwise a list of M LineStrings."""
+    nodes = np.asarray(nodes, dtype=float)
+    points = np.matmul(_sample_weights(nodes.shape[-2] - 1, granularity), nodes)
+    if as_array:
+        return points
+    return list(shapely.linestrings(points))
 
-    return LineString(points)
+def evaluate_beziers(nodes, t):
+    """Evaluate Bezier curves at the parameters t with the Bernstein polynomials.
+    nodes is an (n+1,2) array of control points for one curve, or (M,n+1,2) for M curves of the same degree.
+    Returns a (T,2) or (M,T,2) array of points."""
+    nodes = np.asarray(nodes, dtype=float)
+    return np.matmul(_bernstein(nodes.shape[-2] - 1, np.asarray(t, dtype=float)), nodes)
 
-def random_bezier(bound = 100):
-    """Returns a bezier curve object with points randomized between -bound and bound."""
+def _bernstein(degree, t):
+    """(T,degree+1) matrix of the Bernstein basis polynomials at each parameter in t."""
+    t = t[:, None]
+    k = np.arange(degree + 1)
+    binomial = np.array([comb(degree, i) for i in k])
+    return binomial * t ** k * (1 - t) ** (degree - k)
+
+@lru_cache(maxsize=32)
+def _sample_weights(degree, granularity):
+    """Bernstein matrix for the parameters bezier_to_linestring samples at, kept for reuse (read only)."""
+    weights = _bernstein(degree, _parameters(granularity))
+    weights.flags.writeable = False
+    return weights
+
+def _parameters(granularity):
+    """Every multiple of granularity below 1, then exactly 1.0."""
+    return np.append(np.arange(0,1,granularity), 1.0)
+
+def _nodes(b):
+    """(n+1,2) array of control points of a bezier.Curve or array."""
+    if isinstance(b, bezier.Curve):
+        return b.nodes.T
+    return np.asarray(b, dtype=float)
+
+def _flatness(nodes):
+    """For (K,n+1,2) control points, the largest distance of the inner control points from the chord.
+    Each curve stays within its control polygon, so it's never further than this from the chord."""
+    start = nodes[:, :1]
+    chord = nodes[:, -1:] - start
+    length2 = (chord * chord).sum(axis=2)
+    offset = nodes[:, 1:-1] - start
+    with np.errstate(divide='ignore', invalid='ignore'):
+        along = np.clip((offset * chord).sum(axis=2) / length2, 0.0, 1.0)
+    along[length2[:, 0] == 0] = 0.0
+    distance = np.hypot(*np.moveaxis(offset - along[:, :, None] * chord, 2, 0))
+    return distance.max(axis=1, initial=0.0)
+
+def _split(nodes):
+    """Split (K,n+1,2) control points at t=0.5 with de Casteljau's algorithm, into two (K,n+1,2) halves."""
+    left = [nodes[:, 0]]
+    right = [nodes[:, -1]]
+    level = nodes
+    while level.shape[1] > 1:
+        level = (level[:, :-1] + level[:, 1:]) * 0.5
+        left.append(level[:, 0])
+        right.append(level[:, -1])
+    return np.stack(left, axis=1), np.stack(right[::-1], axis=1)
+
+def flatten_nodes(nodes, tolerance = 0.1, max_depth = 24):
+    """Flatten a Bezier curve given as an (n+1,2) array of control points into an (N,2) array of points,
+    subdividing until every piece's control points are within tolerance of its chord.
+    All the pieces at each level of subdivision are tested and split together."""
+    pieces = np.asarray(nodes, dtype=float)[None]
+    for _ in range(max_depth):
+        split = _flatness(pieces) > tolerance
+        if not split.any():
+            break
+        left, right = _split(pieces[split])
+        # Each piece that is split is replaced by its two halves, in place
+        index = np.cumsum(np.where(split, 2, 1)) - np.where(split, 2, 1)
+        out = np.empty((len(pieces) + split.sum(),) + pieces.shape[1:])
+        out[index[~split]] = pieces[~split]
+        out[index[split]] = left
+        out[index[split] + 1] = right
+        pieces = out
+    return np.concatenate([pieces[:1, 0], pieces[:, -1]])
+
+def random_bezier(bound = 100, as_array = False):
+    """Returns a bezier curve object with points randomized between -bound and bound.
+    If as_array, returns the (4,2) array of control points instead of a bezier.Curve."""
 
     x1 = random.random()*2*bound - bound
     y1 = random.random()*2*bound - bound
@@ -33,6 +124,12 @@ def random_bezier(bound = 100):
     y3 = random.random()*2*bound - bound
     x4 = random.random()*2*bound - bound
     y4 = random.random()*2*bound - bound
+    if as_array:
+        return np.array([[x1,y1],[x2,y2],[x3,y3],[x4,y4]])
     nodes = [[x1,x2,x3,x4],
             [y1,y2,y3,y4]]
     return bezier.Curve.from_nodes(nodes)
+
+def random_beziers(count, bound = 100):
+    """Returns a (count,4,2) array of control points, the same curves as count calls to random_bezier."""
+    return np.array([random.random()*2*bound - bound for _ in range(count * 8)]).reshape(count, 4, 2)
@@ -1,8 +1,38 @@
-from shapely.geometry import LineString, Point
+from concurrent.futures import ProcessPoolExecutor
+from shapely.geometry import LineString, MultiLineString, Point
+from shapely.strtree import STRtree
+import shapely
+import numpy as np
 import math
 
-def diffract(source, dest, lens: LineString, rays = 360, num_layers=6):
-    # TODO: Does the lens HAVE to be a LineString? I would like to use an array of linestrings.
+def diffract(source, dest, lens, rays = 360, num_layers=6, vectorized=True, skip_first=True, workers=None):
+    """
+    Cast rays from points along source to points along dest, and cut each ray at every place it
+    crosses the lens. The pieces of each ray between lens crossings are dealt out to num_layers layers:
+    the piece ending at the i-th crossing goes to layer i % num_layers.
+    Returns a list of num_layers lists of LineStrings.
+
+    lens can be a LineString, a MultiLineString, or any iterable of LineStrings.
+    If skip_first is False, the first piece of each ray (from its start to the first crossing)
+    is also drawn, in layer 0.
+
+    By default the rays are intersected with the lens segments in bulk with array math
+    (see _diffract_vectorized). Set vectorized=False to intersect one ray at a time with shapely.
+    workers sets the number of processes the vectorized path splits the rays across
+    (None means no pool); the output is the same either way.
+    """
+    lens = _lens_parts(lens)
+    if vectorized:
+        return _diffract_vectorized(source, dest, lens, rays, num_layers, skip_first, workers)
+    return _diffract_shapely(source, dest, MultiLineString(lens), rays, num_layers, skip_first)
+
+def _lens_parts(lens):
+    """List of the LineStrings that make up lens."""
+    if isinstance(lens, shapely.Geometry):
+        return list(shapely.get_parts(lens))
+    return [part for geom in lens for part in shapely.get_parts(geom)]
+
+def _diffract_shapely(source, dest, lens, rays, num_layers, skip_first=True):
     sp = Point(0,0)
     dp = Point(0,0)
 
@@ -62,11 +92,190 @@ def diffract(source, dest, lens: LineString, rays = 360, num_layers=6):
 
         for i,p in enumerate(points):
             if i == 0:
-                # Skip the first portion 
-                # TODO: this should be configurable/toggleable
+                # The first portion runs from the start of the ray
+                if not skip_first:
+                    layers[0].append(LineString([(sp.x,sp.y),(p[0],p[1])]))
                 continue
             start = (points[i-1][0],points[i-1][1])
             end = (p[0],p[1])
             #layers[i%len(layers)].add(dwg.line(start=start,end=end,opacity=0.4,stroke_width=0.5))
             layers[i%len(layers)].append(LineString([start,end]))
     return layers
+
+def _ray_endpoints(geom, steps):
+    """(N,2) array of the points at each normalized step along geom, or geom itself if it's a Point."""
+    if geom.geom_type == 'Point':
+        return np.repeat([[geom.x, geom.y]], len(steps), axis=0)
+    if geom.geom_type == 'Polygon':
+        geom = geom.exterior
+    return shapely.get_coordinates(shapely.line_interpolate_point(geom, steps, normalized=True))
+
+def _lens_segments(lens):
+    """
+    (M,2) arrays of the start and end points of every segment of every lens part,
+    and the index of the first segment of each part (plus the total, so part i has
+    segments first[i]:first[i+1]).
+    """
+    coords, part = shapely.get_coordinates(lens, return_index=True)
+    same_part = part[:-1] == part[1:]
+    first = np.searchsorted(part[:-1][same_part], np.arange(len(lens) + 1))
+    return coords[:-1][same_part], coords[1:][same_part], first
+
+def _cross(ax, ay, bx, by):
+    return ax * by - ay * bx
+
+def _ray_hits(p0, p1, q0, q1, ray):
+    """
+    Intersect ray segments p0->p1 with lens segments q0->q1, pair by pair (all (K,2) arrays).
+    ray is the ray index of each pair.
+    Returns the ray index and the position along the ray (0-1) of every intersection point.
+    A lens segment lying along a ray contributes both ends of the overlap, like a LineString intersection.
+    """
+    r = p1 - p0
+    q = q1 - q0
+    qp = q0 - p0
+    denom = _cross(r[:, 0], r[:, 1], q[:, 0], q[:, 1])
+    qp_cross_q = _cross(qp[:, 0], qp[:, 1], q[:, 0], q[:, 1])
+    qp_cross_r = _cross(qp[:, 0], qp[:, 1], r[:, 0], r[:, 1])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = qp_cross_q / denom
+        u = qp_cross_r / denom
+    crossing = (denom != 0) & (t >= 0) & (t <= 1) & (u >= 0) & (u <= 1)
+    hit_ray = [ray[crossing]]
+    hit_t = [t[crossing]]
+
+    # Collinear overlaps
+    length2 = (r * r).sum(axis=1)
+    collinear = (denom == 0) & (qp_cross_r == 0) & (length2 > 0)
+    if collinear.any():
+        rc = r[collinear]
+        t0 = ((q0[collinear] - p0[collinear]) * rc).sum(axis=1) / length2[collinear]
+        t1 = ((q1[collinear] - p0[collinear]) * rc).sum(axis=1) / length2[collinear]
+        low = np.maximum(np.minimum(t0, t1), 0.0)
+        high = np.minimum(np.maximum(t0, t1), 1.0)
+        overlap = low <= high
+        hit_ray += [ray[collinear][overlap]] * 2
+        hit_t += [low[overlap], high[overlap]]
+
+    return np.concatenate(hit_ray), np.concatenate(hit_t)
+
+def _crosses_box(p0, p1, bounds):
+    """
+    For (K,2) ray segments p0->p1 whose bounding boxes overlap (K,4) boxes,
+    whether the line through each ray passes through its box (corners not all on one side).
+    """
+    r = p1 - p0
+    side = np.stack([_cross(r[:, 0], r[:, 1], bounds[:, x] - p0[:, 0], bounds[:, y] - p0[:, 1])
+                     for x, y in ((0, 1), (0, 3), (2, 1), (2, 3))])
+    return (side.min(axis=0) <= 0) & (side.max(axis=0) >= 0)
+
+def _lens_index(lens):
+    """STRtree of the lens parts, their bounds, and their segments (see _lens_segments)."""
+    return STRtree(lens), shapely.bounds(np.asarray(lens, dtype=object)), _lens_segments(lens)
+
+def _find_hits(starts, ends, index, max_pairs=2**20):
+    """
+    Ray index and position along the ray of every crossing of rays starts->ends with the lens.
+    The tree finds the lens parts each ray might cross, so each ray is only tested against the segments
+    of lenses it passes through; those pairs are intersected in chunks of about max_pairs.
+    """
+    tree, bounds, (q0, q1, first) = index
+
+    # Candidate (ray, lens part) pairs: overlapping bounding boxes, and the ray passes through the box
+    ray, part = tree.query(shapely.linestrings(np.stack([starts, ends], axis=1)))
+    near = _crosses_box(starts[ray], ends[ray], bounds[part])
+    ray, part = ray[near], part[near]
+
+    # Expand each candidate to all the segments of its part
+    counts = first[part + 1] - first[part]
+    total = np.cumsum(counts)
+    hit_ray = [np.empty(0, dtype=np.int64)]
+    hit_t = [np.empty(0)]
+    begin = 0
+    while begin < len(ray):
+        done = total[begin] - counts[begin]
+        end = max(begin + 1, np.searchsorted(total, done + max_pairs, side='right'))
+        c = counts[begin:end]
+        pair_ray = np.repeat(ray[begin:end], c)
+        segment = np.repeat(first[part[begin:end]] - (total[begin:end] - c - done), c) + np.arange(c.sum())
+        r, t = _ray_hits(starts[pair_ray], ends[pair_ray], q0[segment], q1[segment], pair_ray)
+        hit_ray.append(r)
+        hit_t.append(t)
+        begin = end
+    return np.concatenate(hit_ray), np.concatenate(hit_t)
+
+def _diffract_vectorized(source, dest, lens, rays, num_layers, skip_first=True, workers=None):
+    """
+    Same output as _diffract_shapely, computed in bulk:
+    all ray endpoints are interpolated at once, an STRtree of the lens parts (built once per call)
+    limits each ray to the segments of lenses it passes through, those pairs are intersected
+    with vectorized segment-segment math, and the hits are sorted along each ray with one lexsort.
+
+    With workers, the rays are split into contiguous chunks that are intersected in a process pool.
+    Each worker gets the lens once (as WKB, in the pool initializer) and builds its own tree.
+    The hits are concatenated in ray order and sorted the same way as in one process,
+    so the output is identical.
+    """
+    if num_layers <= 0:
+        num_layers = 1
+    steps = np.clip(np.arange(rays) / rays, 0.0, 1.0)
+    starts = _ray_endpoints(source, steps)
+    ends = _ray_endpoints(dest, steps)
+
+    if workers is None or rays == 0:
+        hit_ray, hit_t = _find_hits(starts, ends, _lens_index(lens))
+    else:
+        # A few chunks per worker, to even out rays that cross many lenses
+        split = np.linspace(0, rays, min(rays, workers * 4) + 1).astype(int)
+        chunks = [(first, starts[first:last], ends[first:last]) for first, last in zip(split[:-1], split[1:])]
+        wkb = shapely.to_wkb(np.asarray(lens, dtype=object))
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_diffract_worker,
+                                 initargs=(wkb,)) as pool:
+            hits = list(pool.map(_diffract_chunk, chunks))
+        hit_ray = np.concatenate([h[0] for h in hits])
+        hit_t = np.concatenate([h[1] for h in hits])
+    return _layers_from_hits(hit_ray, hit_t, starts, ends, num_layers, skip_first)
+
+def _layers_from_hits(hit_ray, hit_t, starts, ends, num_layers, skip_first=True):
+    """Sort the hits along each ray, drop duplicates, and deal the pieces between them out to the layers."""
+    order = np.lexsort((hit_t, hit_ray))
+    hit_ray = hit_ray[order]
+    hit_t = hit_t[order]
+    points = starts[hit_ray] + hit_t[:, None] * (ends[hit_ray] - starts[hit_ray])
+
+    # A ray through a lens vertex hits both segments that meet there
+    same_ray = np.zeros(len(hit_ray), dtype=bool)
+    same_ray[1:] = hit_ray[1:] == hit_ray[:-1]
+    duplicate = np.zeros(len(hit_ray), dtype=bool)
+    duplicate[1:] = same_ray[1:] & np.all(np.isclose(points[1:], points[:-1], rtol=0, atol=1e-9), axis=1)
+    hit_ray = hit_ray[~duplicate]
+    points = points[~duplicate]
+
+    # Position of each hit along its ray
+    new_ray = np.ones(len(hit_ray), dtype=bool)
+    new_ray[1:] = hit_ray[1:] != hit_ray[:-1]
+    first_hit = np.maximum.accumulate(np.where(new_ray, np.arange(len(hit_ray)), 0))
+    position = np.arange(len(hit_ray)) - first_hit
+
+    # Pieces end at each hit, and start at the previous hit (or at the start of the ray)
+    piece = np.arange(len(hit_ray)) if not skip_first else np.flatnonzero(position > 0)
+    piece_starts = points[np.maximum(piece - 1, 0)]
+    first = position[piece] == 0
+    piece_starts[first] = starts[hit_ray[piece[first]]]
+    lines = shapely.linestrings(np.stack([piece_starts, points[piece]], axis=1))
+    layer = position[piece] % num_layers
+    return [list(lines[layer == i]) for i in range(num_layers)]
+
+# Lens index for pool workers, built once per process by _init_diffract_worker
+_worker_lens = None
+
+def _init_diffract_worker(wkb):
+    """Rebuild the lens parts from WKB and index them."""
+    global _worker_lens
+    _worker_lens = _lens_index(list(shapely.from_wkb(wkb)))
+
+def _diffract_chunk(chunk):
+    """Hits for the rays in chunk = (index of its first ray, starts, ends), with global ray indices."""
+    first, starts, ends = chunk
+    hit_ray, hit_t = _find_hits(starts, ends, _worker_lens)
+    return hit_ray + first, hit_t
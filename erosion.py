@@ -0,0 +1,177 @@
+# Erosion
+# Hydraulic and thermal erosion over a 2D array of heights, modified in place.
+# Hydraulic erosion follows the usual droplet model (as in Hans Theobald Beyer's thesis
+# "Implementation of a method for hydraulic erosion"), but a whole batch of droplets is moved
+# one step at a time with array operations instead of simulating one droplet at a time.
+import time
+import numpy as np
+
+def _bilinear(values, x, y):
+    """Height and gradient at fractional positions x (cols) and y (rows)."""
+    ix = x.astype(np.int64)
+    iy = y.astype(np.int64)
+    fx = x - ix
+    fy = y - iy
+    h00 = values[iy, ix]
+    h10 = values[iy, ix + 1]
+    h01 = values[iy + 1, ix]
+    h11 = values[iy + 1, ix + 1]
+    height = (h00 * (1 - fx) * (1 - fy) + h10 * fx * (1 - fy)
+              + h01 * (1 - fx) * fy + h11 * fx * fy)
+    grad_x = (h10 - h00) * (1 - fy) + (h11 - h01) * fy
+    grad_y = (h01 - h00) * (1 - fx) + (h11 - h10) * fx
+    return height, grad_x, grad_y
+
+def _spread(flat, cols, x, y, amount):
+    """Add amount to the four cells around each position, weighted by distance."""
+    ix = x.astype(np.int64)
+    iy = y.astype(np.int64)
+    fx = x - ix
+    fy = y - iy
+    index = iy * cols + ix
+    np.add.at(flat, index, amount * (1 - fx) * (1 - fy))
+    np.add.at(flat, index + 1, amount * fx * (1 - fy))
+    np.add.at(flat, index + cols, amount * (1 - fx) * fy)
+    np.add.at(flat, index + cols + 1, amount * fx * fy)
+
+def _brush(radius):
+    """Cell offsets within radius, and their weights (falling off linearly, summing to 1)."""
+    r = int(np.ceil(radius))
+    dy, dx = np.mgrid[-r:r+1, -r:r+1]
+    weight = np.maximum(radius - np.hypot(dx, dy), 0.0)
+    keep = weight > 0
+    return dy[keep], dx[keep], weight[keep] / weight[keep].sum()
+
+def _erode(flat, rows, cols, x, y, amount, floor, brush):
+    """
+    Remove amount from the cells around each position, spread over the brush.
+    As in the reference droplet model, no cell gives up more than it holds, and no cell is dug
+    below floor (the height the droplet moves on to), so repeated droplets can't dig pits.
+    Returns the amount actually removed for each position.
+    """
+    removed = np.zeros(len(amount))
+    eroding = amount > 0
+    x, y, amount, floor = x[eroding], y[eroding], amount[eroding], floor[eroding]
+    dy, dx, weight = brush
+    iy = y.astype(np.int64)[:, None] + dy
+    ix = x.astype(np.int64)[:, None] + dx
+    inside = (iy >= 0) & (iy < rows) & (ix >= 0) & (ix < cols)
+    cells = np.where(inside, iy * cols + ix, 0)
+    held = flat[cells]
+    take = np.minimum(amount[:, None] * weight, np.maximum(np.minimum(held, held - floor[:, None]), 0.0))
+    take[~inside] = 0.0
+    np.add.at(flat, cells[inside], -take[inside])
+    removed[eroding] = take.sum(axis=1)
+    return removed
+
+def hydraulic_erosion(values, droplets=50000, rng=None, batch_size=4096, max_steps=64,
+                      inertia=0.05, capacity=4.0, min_capacity=0.01, deposition=0.3,
+                      erosion=0.3, evaporation=0.02, gravity=4.0, radius=3.0, progress=None):
+    """
+    Simulate droplets running down the height map, picking up and depositing sediment.
+    Each droplet starts at a random position and lives for at most max_steps steps.
+    Sediment is picked up from all cells within radius, and no cell is dug below 0 or below
+    the height the droplet moves on to, so the heights stay within their original range.
+    batch_size droplets are simulated together; droplets in the same batch that touch
+    the same cell in the same step have their changes summed.
+    values must be C-contiguous, since it is updated through a flat view.
+
+    progress, if given, is called after each batch as progress(done, droplets, elapsed_seconds).
+    Returns the total elapsed time in seconds.
+    """
+    if not values.flags.c_contiguous:
+        raise ValueError("hydraulic_erosion needs a C-contiguous array of values")
+    if rng is None:
+        rng = np.random.default_rng()
+    rows, cols = values.shape
+    flat = values.reshape(-1)
+    brush = _brush(radius)
+    start = time.perf_counter()
+    done = 0
+    while done < droplets:
+        n = min(batch_size, droplets - done)
+        x = rng.uniform(0, cols - 1, n)
+        y = rng.uniform(0, rows - 1, n)
+        dir_x = np.zeros(n)
+        dir_y = np.zeros(n)
+        speed = np.ones(n)
+        water = np.ones(n)
+        sediment = np.zeros(n)
+
+        for _ in range(max_steps):
+            height, grad_x, grad_y = _bilinear(values, x, y)
+
+            # Steer downhill, keeping some of the previous direction
+            dir_x = dir_x * inertia - grad_x * (1 - inertia)
+            dir_y = dir_y * inertia - grad_y * (1 - inertia)
+            length = np.hypot(dir_x, dir_y)
+            moving = length > 0
+            length[~moving] = 1.0
+            dir_x /= length
+            dir_y /= length
+            new_x = x + dir_x
+            new_y = y + dir_y
+
+            # Droplets stop when they settle in a pit or flow off the map
+            alive = moving & (new_x >= 0) & (new_x < cols - 1) & (new_y >= 0) & (new_y < rows - 1)
+            if not alive.any():
+                break
+            x, y, new_x, new_y = x[alive], y[alive], new_x[alive], new_y[alive]
+            dir_x, dir_y = dir_x[alive], dir_y[alive]
+            speed, water, sediment, height = speed[alive], water[alive], sediment[alive], height[alive]
+
+            new_height = _bilinear(values, new_x, new_y)[0]
+            delta = new_height - height
+            carry = np.maximum(-delta * speed * water * capacity, min_capacity)
+
+            # Deposit when going uphill (filling the pit behind) or carrying too much
+            depositing = (delta > 0) | (sediment > carry)
+            deposit = np.where(delta > 0, np.minimum(delta, sediment), (sediment - carry) * deposition)
+            deposit = np.where(depositing, deposit, 0.0)
+            # Otherwise erode, but never dig deeper than the drop in height
+            erode = np.where(depositing, 0.0, np.minimum((carry - sediment) * erosion, -delta))
+            _spread(flat, cols, x, y, deposit)
+            sediment += _erode(flat, rows, cols, x, y, erode, new_height, brush) - deposit
+
+            speed = np.sqrt(np.maximum(speed * speed - delta * gravity, 0.0))
+            water *= 1 - evaporation
+            x, y = new_x, new_y
+
+        done += n
+        if progress is not None:
+            progress(done, droplets, time.perf_counter() - start)
+    return time.perf_counter() - start
+
+def thermal_erosion(values, iterations=50, talus=0.01, rate=0.5, progress=None):
+    """
+    Move material from cells to their lower 4-connected neighbours wherever the difference
+    in height is more than talus, until slopes settle at about the talus angle.
+    rate is the fraction of the excess that moves each iteration.
+
+    progress, if given, is called after each iteration as progress(done, iterations, elapsed_seconds).
+    Returns the total elapsed time in seconds.
+    """
+    start = time.perf_counter()
+    # Neighbour views: (slice of cells, slice of their neighbours) for each direction
+    shifts = [((slice(None), slice(None, -1)), (slice(None), slice(1, None))),
+              ((slice(None), slice(1, None)), (slice(None), slice(None, -1))),
+              ((slice(None, -1), slice(None)), (slice(1, None), slice(None))),
+              ((slice(1, None), slice(None)), (slice(None, -1), slice(None)))]
+    for i in range(iterations):
+        excess = np.zeros((len(shifts),) + values.shape)
+        for k, (cells, neighbours) in enumerate(shifts):
+            excess[k][cells] = values[cells] - values[neighbours]
+        excess[excess <= talus] = 0.0
+        total = excess.sum(axis=0)
+        steepest = excess.max(axis=0)
+        # Move rate * (steepest - talus), shared out in proportion to each neighbour's excess
+        amount = np.where(steepest > talus, rate * (steepest - talus) / 2.0, 0.0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            share = np.where(total > 0, amount / total, 0.0)
+        for k, (cells, neighbours) in enumerate(shifts):
+            moved = (excess[k] * share)[cells]
+            values[cells] -= moved
+            values[neighbours] += moved
+        if progress is not None:
+            progress(i + 1, iterations, time.perf_counter() - start)
+    return time.perf_counter() - start
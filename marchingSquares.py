@@ -0,0 +1,108 @@
+# Marching Squares
+import numpy as np
+
+# Cell edges, in the order they are stored per cell: top, right, bottom, left
+TOP = 0
+RIGHT = 1
+BOTTOM = 2
+LEFT = 3
+
+# For each 4-bit case code, the (start edge, end edge) of the first and second segment.
+# This mirrors IsoLayer.marching_squares, including the orientation of each segment,
+# so both paths emit identical segments. -1 means there is no segment.
+FIRST_SEGMENT = np.array([
+    [-1, -1],           # 0
+    [LEFT, TOP],        # 1
+    [TOP, RIGHT],       # 2
+    [LEFT, RIGHT],      # 3
+    [RIGHT, BOTTOM],    # 4
+    [TOP, RIGHT],       # 5
+    [TOP, BOTTOM],      # 6
+    [LEFT, BOTTOM],     # 7
+    [LEFT, BOTTOM],     # 8
+    [TOP, BOTTOM],      # 9
+    [LEFT, TOP],        # 10
+    [RIGHT, BOTTOM],    # 11
+    [LEFT, RIGHT],      # 12
+    [TOP, RIGHT],       # 13
+    [LEFT, TOP],        # 14
+    [-1, -1],           # 15
+])
+SECOND_SEGMENT = np.full((16, 2), -1)
+SECOND_SEGMENT[5] = [LEFT, BOTTOM]
+SECOND_SEGMENT[10] = [BOTTOM, RIGHT]
+
+def _interp(val, a, b):
+    """Vectorized version of abs(val-a) / abs(b-a), falling back to 0.5 where a == b."""
+    same = a == b
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = np.abs(val - a) / np.abs(b - a)
+    return np.where(same, 0.5, t)
+
+def marching_squares(values, isovals, max_cells=2**22, row_offset=0):
+    """
+    Run marching squares over a whole 2D array for every value in isovals at once.
+    Returns a list with one (N,2,2) array of segments per iso value, in the same order
+    (and with the same orientation) that HeightMap's per-cell loop would add them.
+    Points are (x,y) = (col,row), matching IsoLayer.
+
+    Rows are processed in bands so that rows * cols * len(isovals) stays around max_cells,
+    which keeps memory bounded on large maps. Only the rows of the current band are read,
+    so values may also be a np.memmap.
+    If values is a band taken from a larger map, row_offset is added to the y coordinates.
+    """
+    isovals = np.atleast_1d(np.asarray(isovals, dtype=float))
+    rows, cols = values.shape
+    num_levels = len(isovals)
+    results = [[] for _ in range(num_levels)]
+    if rows < 2 or cols < 2 or num_levels == 0:
+        return [np.empty((0, 2, 2)) for _ in range(num_levels)]
+
+    band = max(1, int(max_cells // (cols * num_levels)))
+    levels = isovals[:, None, None]
+    for row_start in range(0, rows - 1, band):
+        row_end = min(row_start + band, rows - 1)
+        block = np.asarray(values[row_start:row_end + 1], dtype=float)
+        topleft = block[:-1, :-1]
+        topright = block[:-1, 1:]
+        botleft = block[1:, :-1]
+        botright = block[1:, 1:]
+
+        flags = ((topleft > levels) * 1 + (topright > levels) * 2
+                 + (botright > levels) * 4 + (botleft > levels) * 8)
+        # np.nonzero walks level by level, then row-major, like the per-cell loops
+        level, row, col = np.nonzero((flags != 0) & (flags != 15))
+        if len(level) == 0:
+            continue
+        flags = flags[level, row, col]
+        val = isovals[level]
+        tl = topleft[row, col]
+        tr = topright[row, col]
+        bl = botleft[row, col]
+        br = botright[row, col]
+
+        x = col.astype(float)
+        y = (row + row_start + row_offset).astype(float)
+        points = np.empty((len(level), 4, 2))
+        points[:, TOP, 0] = x + _interp(val, tl, tr)
+        points[:, TOP, 1] = y
+        points[:, RIGHT, 0] = x + 1.0
+        points[:, RIGHT, 1] = y + _interp(val, tr, br)
+        points[:, BOTTOM, 0] = x + _interp(val, bl, br)
+        points[:, BOTTOM, 1] = y + 1.0
+        points[:, LEFT, 0] = x
+        points[:, LEFT, 1] = y + _interp(val, tl, bl)
+
+        # Interleave first and second segments per cell, then drop the missing ones
+        edges = np.stack([FIRST_SEGMENT[flags], SECOND_SEGMENT[flags]], axis=1)
+        keep = edges[:, :, 0] >= 0
+        cell = np.broadcast_to(np.arange(len(level))[:, None], keep.shape)[keep]
+        edges = edges[keep]
+        segments = np.stack([points[cell, edges[:, 0]], points[cell, edges[:, 1]]], axis=1)
+
+        bounds = np.searchsorted(level[cell], np.arange(num_levels + 1))
+        for i in range(num_levels):
+            if bounds[i] < bounds[i + 1]:
+                results[i].append(segments[bounds[i]:bounds[i + 1]])
+
+    return [np.concatenate(r) if r else np.empty((0, 2, 2)) for r in results]
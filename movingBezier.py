@@ -1,5 +1,6 @@
 # Moving Bezier
 import random
+import numpy as np
 from vsketch.curves import *
 from shapely.geometry import LineString, Point
 from shapely import affinity
@@ -19,12 +20,55 @@ class MovingBezier:
         self.bound = bound # Radius to contain randomly generated values within
         self.paths = []
         for i in range(num_paths):
-            self.paths.append(bezier_to_linestring(random_bezier(bound = self.bound)))
+            self.paths.append(bezier_to_linestring(random_bezier(bound = self.bound, as_array = True)))
+        self._tables = [] # (path, arc length table) for frames(), built on first use
 
     def set_path(self, path: LineString,index=0,):
         self.paths[index] = path
 
-    def get_curve(self,t):
+    def _arc_length_tables(self):
+        """For each path, its coordinates and the cumulative distance along it at each coordinate.
+        Tables are kept with the path they were measured for, and remeasured for any path that has been
+        replaced since, however it was replaced (set_path or changing self.paths directly)."""
+        tables = []
+        for p, path in enumerate(self.paths):
+            if p < len(self._tables) and self._tables[p][0] is path:
+                tables.append(self._tables[p])
+                continue
+            coords = np.asarray(path.coords)
+            distance = np.concatenate([[0.0], np.cumsum(np.hypot(*np.diff(coords, axis=0).T))])
+            tables.append((path, (coords, distance)))
+        self._tables = tables
+        return [table for _, table in tables]
+
+    def control_points(self,ts):
+        """The control points of the curve at every timestep in ts, as an (F,n,2) array.
+        Same as get_curve for each t, but the arc length along each path is only measured once."""
+        ts = np.clip(np.asarray(ts, dtype=float), 0.0, 1.0)
+        nodes = np.empty((len(ts), len(self.paths), 2))
+        for p, (coords, distance) in enumerate(self._arc_length_tables()):
+            along = ts * distance[-1]
+            nodes[:, p, 0] = np.interp(along, distance, coords[:, 0])
+            nodes[:, p, 1] = np.interp(along, distance, coords[:, 1])
+        return nodes
+
+    def frames(self,ts,granularity=0.01,stream=False,chunk_size=1024):
+        """The flattened curve at every timestep in ts, as an (F,T,2) array of points
+        (T points per frame, sampled like bezier_to_linestring).
+        If stream, instead returns a generator that yields one LineString per frame,
+        working through chunk_size frames at a time so long animations don't need all frames in memory."""
+        if stream:
+            return self._frame_stream(ts, granularity, chunk_size)
+        return beziers_to_linestrings(self.control_points(ts), granularity, as_array=True)
+
+    def _frame_stream(self,ts,granularity,chunk_size):
+        ts = np.asarray(ts, dtype=float)
+        for start in range(0, len(ts), chunk_size):
+            yield from beziers_to_linestrings(self.control_points(ts[start:start + chunk_size]), granularity)
+
+    def get_curve(self,t,as_array=False):
+        """The curve at timestep t, as a bezier.Curve, or as an (n,2) array of control points if as_array
+        (which can be passed straight to bezier_to_linestring without creating a bezier.Curve)."""
         if t<0.0:
             t = 0.0
         if t > 1.0:
@@ -36,4 +80,6 @@ class MovingBezier:
             x.append(point.x)
             y.append(point.y)
 
+        if as_array:
+            return np.column_stack([x,y])
         return bezier.Curve.from_nodes([x,y])
@@ -0,0 +1,132 @@
+# Simplex Noise
+# Vectorized 2D/3D simplex noise, evaluated over whole coordinate arrays at once.
+# Based on Stefan Gustavson's reference implementation, "Simplex noise demystified".
+# Octaves are combined the same way as the noise package: the sum of each octave scaled by
+# its amplitude, divided by the sum of the amplitudes.
+import numpy as np
+
+GRAD3 = np.array([[1,1,0],[-1,1,0],[1,-1,0],[-1,-1,0],
+                  [1,0,1],[-1,0,1],[1,0,-1],[-1,0,-1],
+                  [0,1,1],[0,-1,1],[0,1,-1],[0,-1,-1]], dtype=float)
+GRAD_X = GRAD3[:, 0].copy()
+GRAD_Y = GRAD3[:, 1].copy()
+GRAD_Z = GRAD3[:, 2].copy()
+
+F2 = 0.5*(np.sqrt(3.0)-1.0)
+G2 = (3.0-np.sqrt(3.0))/6.0
+F3 = 1.0/3.0
+G3 = 1.0/6.0
+
+def permutation(seed=None):
+    """Return a doubled permutation table of 0-255, shuffled deterministically from seed."""
+    perm = np.random.default_rng(seed).permutation(256)
+    return np.concatenate([perm, perm])
+
+def _falloff(t):
+    t = np.maximum(t, 0.0)
+    t = t * t
+    return t * t
+
+def _noise2(x, y, perm):
+    perm12 = perm % 12
+    s = (x + y) * F2
+    i = np.floor(x + s)
+    j = np.floor(y + s)
+    t = (i + j) * G2
+    x0 = x - (i - t)
+    y0 = y - (j - t)
+
+    i1 = (x0 > y0).astype(np.int64)
+    j1 = 1 - i1
+    x1 = x0 - i1 + G2
+    y1 = y0 - j1 + G2
+    x2 = x0 - 1.0 + 2.0 * G2
+    y2 = y0 - 1.0 + 2.0 * G2
+
+    ii = i.astype(np.int64) & 255
+    jj = j.astype(np.int64) & 255
+    g0 = perm12.take(ii + perm.take(jj))
+    g1 = perm12.take(ii + i1 + perm.take(jj + j1))
+    g2 = perm12.take(ii + 1 + perm.take(jj + 1))
+
+    n = _falloff(0.5 - x0*x0 - y0*y0) * (GRAD_X.take(g0)*x0 + GRAD_Y.take(g0)*y0)
+    n += _falloff(0.5 - x1*x1 - y1*y1) * (GRAD_X.take(g1)*x1 + GRAD_Y.take(g1)*y1)
+    n += _falloff(0.5 - x2*x2 - y2*y2) * (GRAD_X.take(g2)*x2 + GRAD_Y.take(g2)*y2)
+    return 70.0 * n
+
+def _noise3(x, y, z, perm):
+    perm12 = perm % 12
+    s = (x + y + z) * F3
+    i = np.floor(x + s)
+    j = np.floor(y + s)
+    k = np.floor(z + s)
+    t = (i + j + k) * G3
+    x0 = x - (i - t)
+    y0 = y - (j - t)
+    z0 = z - (k - t)
+
+    # Offsets of the second corner (the largest of x0,y0,z0) and third corner (all but the smallest)
+    xy = x0 >= y0
+    yz = y0 >= z0
+    xz = x0 >= z0
+    i1 = (xy & xz).astype(np.int64)
+    j1 = (~xy & yz).astype(np.int64)
+    k1 = (~xz & ~yz).astype(np.int64)
+    i2 = (xy | xz).astype(np.int64)
+    j2 = (~xy | yz).astype(np.int64)
+    k2 = (~(xz & yz)).astype(np.int64)
+
+    x1 = x0 - i1 + G3
+    y1 = y0 - j1 + G3
+    z1 = z0 - k1 + G3
+    x2 = x0 - i2 + 2.0 * G3
+    y2 = y0 - j2 + 2.0 * G3
+    z2 = z0 - k2 + 2.0 * G3
+    x3 = x0 - 1.0 + 3.0 * G3
+    y3 = y0 - 1.0 + 3.0 * G3
+    z3 = z0 - 1.0 + 3.0 * G3
+
+    ii = i.astype(np.int64) & 255
+    jj = j.astype(np.int64) & 255
+    kk = k.astype(np.int64) & 255
+    g0 = perm12.take(ii + perm.take(jj + perm.take(kk)))
+    g1 = perm12.take(ii + i1 + perm.take(jj + j1 + perm.take(kk + k1)))
+    g2 = perm12.take(ii + i2 + perm.take(jj + j2 + perm.take(kk + k2)))
+    g3 = perm12.take(ii + 1 + perm.take(jj + 1 + perm.take(kk + 1)))
+
+    n = _falloff(0.6 - x0*x0 - y0*y0 - z0*z0) * (GRAD_X.take(g0)*x0 + GRAD_Y.take(g0)*y0 + GRAD_Z.take(g0)*z0)
+    n += _falloff(0.6 - x1*x1 - y1*y1 - z1*z1) * (GRAD_X.take(g1)*x1 + GRAD_Y.take(g1)*y1 + GRAD_Z.take(g1)*z1)
+    n += _falloff(0.6 - x2*x2 - y2*y2 - z2*z2) * (GRAD_X.take(g2)*x2 + GRAD_Y.take(g2)*y2 + GRAD_Z.take(g2)*z2)
+    n += _falloff(0.6 - x3*x3 - y3*y3 - z3*z3) * (GRAD_X.take(g3)*x3 + GRAD_Y.take(g3)*y3 + GRAD_Z.take(g3)*z3)
+    return 32.0 * n
+
+def snoise2(x, y, perm, octaves=1, persistence=0.5, lacunarity=2.0):
+    """2D simplex noise over arrays of x and y coordinates, in the range -1.0 to 1.0."""
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    total = 0.0
+    amplitude = 1.0
+    frequency = 1.0
+    max_amplitude = 0.0
+    for _ in range(octaves):
+        total = total + _noise2(x * frequency, y * frequency, perm) * amplitude
+        max_amplitude += amplitude
+        frequency *= lacunarity
+        amplitude *= persistence
+    return total / max_amplitude
+
+def snoise3(x, y, z, perm, octaves=1, persistence=0.5, lacunarity=2.0):
+    """3D simplex noise over arrays of x, y and z coordinates, in the range -1.0 to 1.0."""
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    z = np.asarray(z, dtype=float)
+    total = 0.0
+    amplitude = 1.0
+    frequency = 1.0
+    max_amplitude = 0.0
+    for _ in range(octaves):
+        total = total + _noise3(x * frequency, y * frequency, z * frequency, perm) * amplitude
+        max_amplitude += amplitude
+        frequency *= lacunarity
+        amplitude *= persistence
+    return total / max_amplitude
@@ -1,16 +1,90 @@
 import math
 import random
+from concurrent.futures import ProcessPoolExecutor
+from fractions import Fraction
+import numpy as np
+import shapely
 from shapely.geometry import LineString, Point
 # Idea - this could be a 'star' generator instead of spirographing
 # TODO: some sort of 'path' object?
 
+def hypotrochoid(angles, inner_r, marker_r, cx, cy, radius):
+    '''(N,2) array of spirograph points at angles (in radians): the inner circle's center plus the marker's
+    offset from it, rotated by angle*(1+1/inner_r). The parameters can be scalars or arrays matching angles.'''
+    angles = np.asarray(angles, dtype=float)
+    inner_r, marker_r, cx, cy, radius = (np.asarray(p, dtype=float) for p in (inner_r, marker_r, cx, cy, radius))
+    theta = angles * (1.0 + 1.0/inner_r)
+    x = (1.0-inner_r)*np.cos(angles) + inner_r*marker_r*np.cos(theta)
+    y = (1.0-inner_r)*np.sin(angles) + inner_r*marker_r*np.sin(theta)
+    return np.column_stack([radius*x + cx, radius*y + cy])
+
+def period(inner_r):
+    '''Number of rotations after which a spirograph with this inner_r closes (see Spirograph.get_period).'''
+    return Fraction(inner_r).limit_denominator(1000).numerator
+
+def spirograph_family(inner_r, marker_r, center=(0,0), radius=1.0, rotations=None, step=1,
+                      packed=False, chunk_size=2**16, workers=None):
+    '''Evaluate many spirographs at once, e.g. a sheet of them laid out on a Grid.
+    inner_r, marker_r, radius and rotations can be scalars or arrays with one value per curve,
+    and center a single (x,y) or an array of them (Grid.centers works).
+    Each curve is drawn like Spirograph.get_linestring: every step degrees for its rotations,
+    or for exactly one closed period if rotations is None.
+    All the points are evaluated together in chunks of whole curves of about chunk_size points,
+    which can be shared out over a process pool of workers.
+    Returns a list of LineStrings, or if packed, an (N,2) array of all the coordinates and
+    the offsets where each curve starts (curve i is coords[offsets[i]:offsets[i+1]]).'''
+    center = np.asarray(center, dtype=float).reshape(-1, 2)
+    inner_r, marker_r, radius, cx, cy = np.broadcast_arrays(
+        np.asarray(inner_r, dtype=float), np.asarray(marker_r, dtype=float),
+        np.asarray(radius, dtype=float), center[:, 0], center[:, 1])
+    inner_r, marker_r, radius, cx, cy = (np.array(a).reshape(-1) for a in (inner_r, marker_r, radius, cx, cy))
+    closed = rotations is None
+    if closed:
+        rotations = [period(r) for r in inner_r]
+    ends = np.broadcast_to(np.asarray(rotations, dtype=float) * 360, inner_r.shape)
+    if closed:
+        counts = np.ceil(ends / step).astype(np.int64) + 1
+    else:
+        counts = np.ceil(np.floor(ends) / step).astype(np.int64)
+    offsets = np.concatenate([[0], np.cumsum(counts)])
+
+    # Chunks of whole curves
+    split = np.unique(np.searchsorted(offsets[1:], np.arange(chunk_size, offsets[-1], chunk_size)) + 1)
+    bounds = np.concatenate([[0], split[split < len(counts)], [len(counts)]])
+    chunks = [(counts[a:b], ends[a:b], closed, step, inner_r[a:b], marker_r[a:b], cx[a:b], cy[a:b], radius[a:b])
+              for a, b in zip(bounds[:-1], bounds[1:])]
+    if workers is None:
+        parts = list(map(_family_chunk, chunks))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            parts = list(pool.map(_family_chunk, chunks))
+    coords = np.concatenate(parts) if parts else np.empty((0, 2))
+    if packed:
+        return coords, offsets
+    return list(shapely.linestrings(coords, indices=np.repeat(np.arange(len(counts)), counts)))
+
+def _family_chunk(chunk):
+    '''Points of a chunk of spirograph_family curves, one after another.'''
+    counts, ends, closed, step, *params = chunk
+    first = np.repeat(np.cumsum(counts) - counts, counts)
+    degrees = (np.arange(counts.sum()) - first) * float(step)
+    if closed:
+        # The last point of each curve is the end of its period
+        degrees[np.cumsum(counts) - 1] = ends
+    inner_r, marker_r, cx, cy, radius = (np.repeat(p, counts) for p in params)
+    points = hypotrochoid(np.radians(degrees), inner_r, marker_r, cx, cy, radius)
+    if closed:
+        # which is back at the start up to rounding; make it exact so each curve is closed
+        points[np.cumsum(counts) - 1] = points[first[np.cumsum(counts) - 1]]
+    return points
+
 class Spirograph:
     '''Object that can be queried to get coordinates at specified step'''
 
     def __init__(self, center=(0,0), radius=1.0):
         n = random.randint(22,179) # Arbitrarily limiting it so it's not SO small sometimes
+        self.n = n
         self.inner_r = n/180.0
-        print(self.inner_r)
         self.marker_r = random.random()*1.5 # Percentage of smaller circle
         self.set_angle(0)
         self.center = center
@@ -85,10 +159,53 @@ class Spirograph:
     def get_path(self, step):
         '''Return a list of tuples representing all coordinates every step'''
         pass
-    def get_linestring(self,rotations=8,step=1):
-        coords = []
-        self.set_angle(0)
-        for theta in range(0,int(360*rotations),step):
-            self.set_angle(math.radians(theta))
-            coords.append(self.get_xy())
-        return LineString(coords)
+
+    def get_period(self):
+        '''Number of rotations after which the curve closes.
+        The inner circle turns 1+1/inner_r times per rotation, so with inner_r = n/180 the curve
+        is back at the start after the numerator of n/180 (in lowest terms) rotations.
+        If inner_r has been set to something other than n/180, it's approximated by a fraction.'''
+        if self.inner_r == self.n/180.0:
+            return Fraction(self.n, 180).numerator
+        return period(self.inner_r)
+
+    def get_points(self, angles):
+        '''Return an (N,2) array of x,y coordinates for an array of angles (in radians),
+        the same points get_xy gives after set_angle, computed in closed form (see hypotrochoid).'''
+        return hypotrochoid(angles, self.inner_r, self.marker_r, self.center[0], self.center[1], self.radius)
+
+    def _adaptive_angles(self, end, tolerance, fine_step=0.1):
+        '''Angles (in degrees) from 0 to end, spaced so that each chord stays within about tolerance of the curve.
+        A chord spanning d radians is off by at most |acceleration|*d^2/8, so the spacing is
+        sqrt(8*tolerance/|acceleration|), found by integrating the point density over a fine grid of angles.'''
+        fine = np.append(np.arange(0, end, fine_step), end)
+        a = np.radians(fine)
+        r = self.inner_r
+        w = 1.0 + 1.0/r
+        ax = (1.0-r)*np.cos(a) + r*self.marker_r*w*w*np.cos(a*w)
+        ay = (1.0-r)*np.sin(a) + r*self.marker_r*w*w*np.sin(a*w)
+        density = np.sqrt(self.radius*np.hypot(ax, ay) / (8.0*tolerance))
+        count = np.concatenate([[0.0], np.cumsum((density[1:] + density[:-1]) * 0.5 * np.diff(a))])
+        samples = int(math.ceil(count[-1])) + 1
+        return np.interp(np.linspace(0, count[-1], samples), count, fine)
+
+    def get_linestring(self,rotations=None,step=1,tolerance=None):
+        '''Return the curve as a LineString, evaluated every step degrees (which can be fractional).
+        If rotations is None, the curve is drawn for exactly one period (see get_period) and closed.
+        If tolerance is given, step is ignored and points are spaced adaptively,
+        closer together where the curve bends sharply.'''
+        if rotations is None:
+            end = 360*self.get_period()
+            if tolerance is not None:
+                degrees = self._adaptive_angles(end, tolerance)
+            else:
+                degrees = np.append(np.arange(0, end, step), end)
+        elif tolerance is not None:
+            degrees = self._adaptive_angles(360*rotations, tolerance)
+        else:
+            degrees = np.arange(0, int(360*rotations), step)
+        points = self.get_points(np.radians(degrees))
+        if rotations is None:
+            # The end of the period lands back on the start up to rounding; make it exact so the line is closed
+            points[-1] = points[0]
+        return LineString(points)
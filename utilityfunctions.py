@@ -1,4 +1,6 @@
+from concurrent.futures import ThreadPoolExecutor
 from shapely.geometry import LineString,MultiLineString
+import shapely
 import numpy as np
 
 def cm(n):
@@ -11,7 +13,7 @@ def mm(n):
 def in_to_cm(n):
     return n*2.54
 
-def crop_linestring(bound,ls):
+def crop_linestring(bound,ls,on_problem=None):
     """Get the intersection LineString without slicing at self-intersections
     When you use the shapely intersection method to crop a linestring so it fits within a polygon,
     Shapely also cuts the LineString at all of its self-intersections. Obviously this creates problems 
@@ -21,33 +23,129 @@ def crop_linestring(bound,ls):
     The goal of this function is to do the intersection without cutting the line to pieces.
     https://stackoverflow.com/questions/35760810/how-to-preserve-a-complex-line-during-shapely-intersection
     https://gis.stackexchange.com/questions/403121/python-shapely-crop-clip-using-intersection-cropped-line-is-split-at-self-i
+
+    Each segment of the line is cropped separately, and the pieces are joined back into runs
+    wherever a piece starts where the previous one ended. All segments are classified at once:
+    segments fully inside the bound are kept as they are, segments that don't touch it are dropped,
+    and only the segments crossing its edge are intersected with it.
+    If a piece doesn't start where the run got to (e.g. the segment leaves and re-enters the bound),
+    a new run is started and on_problem, if given, is called as on_problem(segment_index, run_end, piece_start).
+    Returns a MultiLineString of the runs.
+    """
+    coords, vertex_line = shapely.get_coordinates(ls, return_index=True)
+    callback = None if on_problem is None else lambda line, *problem: on_problem(*problem)
+    runs, _ = _crop_runs(bound, coords, vertex_line, callback)
+    return MultiLineString(list(runs))
+
+def crop_linestrings(bound,lines,workers=None,on_problem=None,chunk_size=100000):
+    """Crop many LineStrings to bound, like crop_linestring, e.g. a whole sketch to SketchBorder.get_bound().
+    The bound is prepared once and every line is checked against it at once: lines fully inside are kept
+    whole, lines that don't touch it are dropped, and only the lines crossing its edge are cropped,
+    segment by segment, all together (in chunks of about chunk_size vertices).
+    With workers, the chunks are cropped on a thread pool (shapely releases the GIL),
+    each against its own prepared copy of bound.
+    on_problem is called as on_problem(line_index, segment_index, run_end, piece_start).
+    Returns a list with one MultiLineString per line, in the same order.
+    """
+    lines = np.asarray(lines, dtype=object)
+    shapely.prepare(bound)
+    inside = shapely.contains(bound, lines)
+    crossing = np.flatnonzero(~inside & shapely.intersects(bound, lines))
+
+    cropped = [MultiLineString()] * len(lines)
+    for i in np.flatnonzero(inside):
+        cropped[i] = MultiLineString([lines[i]])
+
+    # Split the crossing lines into chunks of whole lines
+    ends = np.cumsum(shapely.get_num_coordinates(lines[crossing]))
+    split = np.unique(np.searchsorted(ends, np.arange(chunk_size, ends[-1] if len(ends) else 0, chunk_size)) + 1)
+    chunks = np.split(crossing, split[split < len(crossing)])
+
+    def crop(chunk):
+        coords, vertex_line = shapely.get_coordinates(lines[chunk], return_index=True)
+        callback = None if on_problem is None else lambda line, *problem: on_problem(int(chunk[line]), *problem)
+        # A prepared geometry isn't safe to share between threads, so each thread prepares its own copy
+        local_bound = bound if workers is None else shapely.from_wkb(shapely.to_wkb(bound))
+        runs, run_line = _crop_runs(local_bound, coords, vertex_line, callback)
+        return chunk, runs, run_line
+
+    if workers is None:
+        results = map(crop, chunks)
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(crop, chunks))
+    for chunk, runs, run_line in results:
+        first = np.searchsorted(run_line, np.arange(len(chunk) + 1))
+        for k, i in enumerate(chunk):
+            cropped[i] = MultiLineString(list(runs[first[k]:first[k + 1]]))
+    return cropped
+
+def _crop_runs(bound,coords,vertex_line,on_problem=None):
+    """Crop the lines made of coords (vertex_line is the line index of each vertex, ascending) to bound
+    without splitting them at self-intersections. See crop_linestring.
+    Returns an array of the runs and the line index of each run.
     """
-    segments = [LineString(x).intersection(bound) for x in zip(ls.coords, ls.coords[1:])]
-    lines = [] # Output
-    line = [] # Building zone for the linestring
-    
-    for segment in segments:
-        if len(segment.coords) == 0:
-            if len(line) > 0:
-                lines.append(LineString(line))
-            line = []
-        else:
-            if len(line) == 0:
-                line.append(segment.coords[0])
-
-            if line[-1] != segment.coords[0]:
-                print('broken segment')
-                lines.append(LineString(line))
-                line = []
-                line.append(segment.coords[0])
-
-            line.append(segment.coords[1])
-
-
-    if len(line) > 0:
-        lines.append(LineString(line))
-
-    return MultiLineString(lines)
+    valid = vertex_line[:-1] == vertex_line[1:]
+    segment = np.flatnonzero(valid)
+    if len(segment) == 0:
+        return np.empty(0, dtype=object), np.empty(0, dtype=np.int64)
+    shapely.prepare(bound)
+    starts, ends = coords[:-1], coords[1:]
+    lines = shapely.linestrings(np.stack([starts[segment], ends[segment]], axis=1))
+
+    # Only segments with both ends inside can be contained; the rest might still cross the bound
+    inside = shapely.contains_xy(bound, coords[:, 0], coords[:, 1])
+    contained = (inside[:-1] & inside[1:])[segment]
+    contained[contained] = shapely.contains(bound, lines[contained])
+    crossing = ~contained
+    crossing[crossing] = shapely.intersects(bound, lines[crossing])
+
+    # Crop the crossing segments, keeping only the line parts, ordered and oriented along the segment
+    parts, index = shapely.get_parts(shapely.intersection(lines[crossing], bound), return_index=True)
+    is_line = shapely.get_type_id(parts) == 1
+    parts, part_segment = parts[is_line], segment[crossing][index[is_line]]
+    part_starts = shapely.get_coordinates(shapely.get_point(parts, 0))
+    part_ends = shapely.get_coordinates(shapely.get_point(parts, -1))
+    direction = ends[part_segment] - starts[part_segment]
+    along_start = ((part_starts - starts[part_segment]) * direction).sum(axis=1)
+    along_end = ((part_ends - starts[part_segment]) * direction).sum(axis=1)
+    backwards = along_end < along_start
+    part_starts[backwards], part_ends[backwards] = part_ends[backwards], part_starts[backwards].copy()
+    along_start[backwards] = along_end[backwards]
+
+    # All pieces in line order
+    kept = segment[contained]
+    piece_segment = np.concatenate([kept, part_segment])
+    order = np.lexsort((np.concatenate([np.zeros(len(kept)), along_start]), piece_segment))
+    if len(order) == 0:
+        return np.empty(0, dtype=object), np.empty(0, dtype=np.int64)
+    piece_segment = piece_segment[order]
+    piece_starts = np.concatenate([starts[kept], part_starts])[order]
+    piece_ends = np.concatenate([ends[kept], part_ends])[order]
+
+    # A new run starts after a skipped segment (or the end of a line),
+    # or where a piece doesn't continue the last one
+    new_run = np.ones(len(order), dtype=bool)
+    follows = np.diff(piece_segment) <= 1
+    broken = follows & np.any(piece_starts[1:] != piece_ends[:-1], axis=1)
+    new_run[1:] = ~follows | broken
+    if on_problem is not None:
+        first_vertex = np.searchsorted(vertex_line, vertex_line)
+        for i in np.flatnonzero(broken) + 1:
+            line = vertex_line[piece_segment[i]]
+            on_problem(int(line), int(piece_segment[i] - first_vertex[piece_segment[i]]),
+                       tuple(piece_ends[i - 1].tolist()), tuple(piece_starts[i].tolist()))
+
+    # Each run is the start of its first piece followed by the end of every piece
+    run = np.cumsum(new_run) - 1
+    first = np.flatnonzero(new_run)
+    points = np.empty((len(order) + len(first), 2))
+    point_run = np.empty(len(points), dtype=np.int64)
+    points[np.arange(len(order)) + run + 1] = piece_ends
+    point_run[np.arange(len(order)) + run + 1] = run
+    points[first + run[first]] = piece_starts[first]
+    point_run[first + run[first]] = run[first]
+    return shapely.linestrings(points, indices=point_run), vertex_line[piece_segment[first]]
 
 def getxy(startx,starty,radius,theta):
     """Get an x,y tuple based on starting coordinate, distance, and angle"""